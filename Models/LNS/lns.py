@@ -0,0 +1,355 @@
+import time
+import random
+import numpy as np
+from util import pad_routes, evaluate_routes
+
+# Routes are lists of 0-based items, the depot is node n of the distance matrix.
+# Every move only looks at the arcs around the positions it touches, so its
+# effect on the two routes involved is computed in O(1) from D.
+
+
+def route_cost(route, D, depot):
+    if not route:
+        return 0
+    nodes = [depot] + route + [depot]
+    return int(D[nodes[:-1], nodes[1:]].sum())
+
+
+def to_routes(routes):
+    return [[item + 1 for item in route] for route in routes]
+
+
+def from_routes(routes):
+    return [[item - 1 for item in route] for route in routes]
+
+
+def pack_items(n, l, s, deadline=None):
+    # Best fit decreasing, retried on random orders of items with equal size and,
+    # as a last resort, a depth-first search for the tightly packed instances,
+    # abandoned at the deadline. None when no packing is found.
+    order = sorted(range(n), key=lambda j: -s[j])
+    rng = random.Random(0)
+    for attempt in range(50):
+        residual = list(l)
+        assignment = [[] for _ in l]
+        for j in order:
+            fitting = [k for k in range(len(l)) if residual[k] >= s[j]]
+            if not fitting:
+                break
+            k = min(fitting, key=lambda k: residual[k])
+            assignment[k].append(j)
+            residual[k] -= s[j]
+        else:
+            return assignment
+        order = sorted(range(n), key=lambda j: (-s[j], rng.random()))
+
+    residual = list(l)
+    assignment = [[] for _ in l]
+
+    def search(idx):
+        if idx == n:
+            return True
+        if deadline is not None and time.time() > deadline:
+            return False
+        j = order[idx]
+        tried = set()
+        for k in range(len(l)):
+            if residual[k] >= s[j] and residual[k] not in tried:
+                tried.add(residual[k])
+                residual[k] -= s[j]
+                assignment[k].append(j)
+                if search(idx + 1):
+                    return True
+                assignment[k].pop()
+                residual[k] += s[j]
+        return False
+
+    return assignment if search(0) else None
+
+
+def nearest_neighbour(items, D, depot):
+    route = []
+    remaining = set(items)
+    curr = depot
+    while remaining:
+        curr = min(remaining, key=lambda j: D[curr, j])
+        route.append(curr)
+        remaining.remove(curr)
+    return route
+
+
+def initial_solution(m, n, s, l, D, deadline=None):
+    # Greedy min-max insertion: items by decreasing size, each one in the position
+    # of the courier that keeps the longest route shortest. Falls back to a
+    # packing of the items followed by nearest neighbour when capacities are tight.
+    D = np.asarray(D)
+    depot = n
+    routes = [[] for _ in range(m)]
+    costs = [0] * m
+    loads = [0] * m
+    for j in sorted(range(n), key=lambda j: -s[j]):
+        best = None
+        for k in range(m):
+            if loads[k] + s[j] > l[k]:
+                continue
+            nodes = np.array([depot] + routes[k] + [depot])
+            deltas = D[nodes[:-1], j] + D[j, nodes[1:]] - D[nodes[:-1], nodes[1:]]
+            q = int(np.argmin(deltas))
+            new_cost = costs[k] + int(deltas[q])
+            key = (max(new_cost, max(costs)), new_cost)
+            if best is None or key < best[0]:
+                best = (key, k, q)
+        if best is None:
+            break
+        _, k, q = best
+        routes[k].insert(q, j)
+        costs[k] = route_cost(routes[k], D, depot)
+        loads[k] += s[j]
+    else:
+        return routes
+
+    assignment = pack_items(n, l, s, deadline)
+    if assignment is None:
+        return None
+    return [nearest_neighbour(items, D, depot) for items in assignment]
+
+
+class LNS:
+    def __init__(self, m, n, s, l, D, routes, seed=0):
+        self.m = m
+        self.n = n
+        self.depot = n
+        self.s = np.asarray(s, dtype=np.int64)
+        self.l = list(l)
+        self.D = np.asarray(D, dtype=np.int64)
+        self.rng = random.Random(seed)
+        self.set_routes(routes)
+
+    def set_routes(self, routes):
+        self.routes = [list(route) for route in routes]
+        self.costs = [0] * self.m
+        self.loads = [0] * self.m
+        self.cache = [None] * self.m
+        for k in range(self.m):
+            self.update(k)
+
+    def update(self, k):
+        # Nodes of the route with the depot at both ends, forward and backward
+        # cumulative costs (for segment costs and reversals) and cumulative loads
+        D = self.D
+        nodes = np.array([self.depot] + self.routes[k] + [self.depot])
+        forward = np.concatenate(([0], np.cumsum(D[nodes[:-1], nodes[1:]])))
+        backward = np.concatenate(([0], np.cumsum(D[nodes[1:], nodes[:-1]])))
+        loads = np.concatenate(([0], np.cumsum(self.s[nodes[1:-1]])))
+        self.cache[k] = (nodes, forward, backward, loads)
+        self.costs[k] = int(forward[-1])
+        self.loads[k] = int(loads[-1])
+
+    def key(self):
+        return (max(self.costs), sum(self.costs))
+
+    def segments(self, k, length):
+        # All segments nodes[p..p+length-1] of route k, 1 <= p <= size - length + 1
+        nodes, forward, _, loads = self.cache[k]
+        p = np.arange(1, len(nodes) - length)
+        inner = forward[p + length - 1] - forward[p]
+        load = loads[p + length - 1] - loads[p - 1]
+        return p, nodes[p - 1], nodes[p], nodes[p + length - 1], nodes[p + length], inner, load
+
+    def best_two_opt(self, c):
+        D = self.D
+        nodes, forward, backward, _ = self.cache[c]
+        size = len(nodes)
+        if size < 4:
+            return None
+        # Reverse nodes[i..j], 1 <= i < j <= size - 2
+        i, j = np.triu_indices(size - 1, k=1)
+        mask = i >= 1
+        i, j = i[mask], j[mask]
+        delta = (D[nodes[i - 1], nodes[j]] + D[nodes[i], nodes[j + 1]]
+                 - D[nodes[i - 1], nodes[i]] - D[nodes[j], nodes[j + 1]]
+                 + (backward[j] - backward[i]) - (forward[j] - forward[i]))
+        best = int(np.argmin(delta))
+        if delta[best] >= 0:
+            return None
+        new_cost = self.costs[c] + int(delta[best])
+        a, b = int(i[best]) - 1, int(j[best]) - 1
+        route = self.routes[c][:a] + self.routes[c][a:b + 1][::-1] + self.routes[c][b + 1:]
+        return (new_cost, new_cost), {c: route}
+
+    def best_pair(self, new_cost_c, new_cost_r, feasible):
+        if not feasible.any():
+            return None, None
+        pair_max = np.where(feasible, np.maximum(new_cost_c, new_cost_r), np.iinfo(np.int64).max)
+        pair_sum = np.where(feasible, new_cost_c + new_cost_r, np.iinfo(np.int64).max)
+        idx = np.unravel_index(np.lexsort((pair_sum.ravel(), pair_max.ravel()))[0], pair_max.shape)
+        return (int(pair_max[idx]), int(pair_sum[idx])), idx
+
+    def best_relocate(self, c, max_length=3):
+        # Relocate (length 1) and or-opt (length 2-3) of a segment of route c
+        # into any position of any other route
+        D = self.D
+        best = None
+        for length in range(1, min(max_length, len(self.routes[c])) + 1):
+            p, prev, first, last, nxt, inner, load = self.segments(c, length)
+            new_cost_c = self.costs[c] - D[prev, first] - D[last, nxt] - inner + D[prev, nxt]
+            for r in range(self.m):
+                if r == c:
+                    continue
+                nodes = self.cache[r][0]
+                a, b = nodes[:-1], nodes[1:]
+                # Segments along the rows, insertion positions along the columns
+                new_cost_r = (self.costs[r] + D[a[None, :], first[:, None]] + D[last[:, None], b[None, :]]
+                              + inner[:, None] - D[a, b][None, :])
+                feasible = np.broadcast_to((self.loads[r] + load <= self.l[r])[:, None], new_cost_r.shape)
+                key, idx = self.best_pair(np.broadcast_to(new_cost_c[:, None], new_cost_r.shape), new_cost_r, feasible)
+                if key is not None and (best is None or key < best[0]):
+                    start, q = int(p[idx[0]]) - 1, int(idx[1])
+                    segment = self.routes[c][start:start + length]
+                    route_c = self.routes[c][:start] + self.routes[c][start + length:]
+                    route_r = self.routes[r][:q] + segment + self.routes[r][q:]
+                    best = (key, {c: route_c, r: route_r})
+        return best
+
+    def best_exchange(self, c, max_length=3):
+        # Swap (length 1 against 1) and cross-exchange (segments up to max_length)
+        # between route c and any other route
+        D = self.D
+        best = None
+        for length_c in range(1, min(max_length, len(self.routes[c])) + 1):
+            p, prev_c, first_c, last_c, nxt_c, inner_c, load_c = self.segments(c, length_c)
+            prev_c, first_c, last_c, nxt_c = prev_c[:, None], first_c[:, None], last_c[:, None], nxt_c[:, None]
+            inner_c, load_c = inner_c[:, None], load_c[:, None]
+            for r in range(self.m):
+                if r == c:
+                    continue
+                for length_r in range(1, min(max_length, len(self.routes[r])) + 1):
+                    q, prev_r, first_r, last_r, nxt_r, inner_r, load_r = self.segments(r, length_r)
+                    new_cost_c = (self.costs[c]
+                                  - D[prev_c, first_c] - D[last_c, nxt_c] - inner_c
+                                  + D[prev_c, first_r] + D[last_r, nxt_c] + inner_r)
+                    new_cost_r = (self.costs[r]
+                                  - D[prev_r, first_r] - D[last_r, nxt_r] - inner_r
+                                  + D[prev_r, first_c] + D[last_c, nxt_r] + inner_c)
+                    feasible = ((self.loads[c] - load_c + load_r <= self.l[c])
+                                & (self.loads[r] - load_r + load_c <= self.l[r]))
+                    key, idx = self.best_pair(new_cost_c, new_cost_r, feasible)
+                    if key is not None and (best is None or key < best[0]):
+                        a, b = int(p[idx[0]]) - 1, int(q[idx[1]]) - 1
+                        segment_c = self.routes[c][a:a + length_c]
+                        segment_r = self.routes[r][b:b + length_r]
+                        route_c = self.routes[c][:a] + segment_r + self.routes[c][a + length_c:]
+                        route_r = self.routes[r][:b] + segment_c + self.routes[r][b + length_r:]
+                        best = (key, {c: route_c, r: route_r})
+        return best
+
+    def apply(self, changes):
+        for k, route in changes.items():
+            self.routes[k] = route
+            self.update(k)
+
+    def local_search(self, deadline):
+        # Improve the longest route until no move shortens it
+        while time.time() < deadline:
+            c = int(np.argmax(self.costs))
+            candidates = [move(c) for move in [self.best_two_opt, self.best_relocate, self.best_exchange]]
+            candidates = [candidate for candidate in candidates
+                          if candidate is not None and candidate[0][0] < self.costs[c]]
+            if not candidates:
+                return
+            _, changes = min(candidates, key=lambda candidate: candidate[0])
+            self.apply(changes)
+
+    def destroy(self, size):
+        # Remove a segment of the longest route together with the items closest to it
+        c = int(np.argmax(self.costs))
+        route = self.routes[c]
+        removed = set()
+        if route:
+            start = self.rng.randrange(len(route))
+            removed.update(route[start:start + max(1, size // 2)])
+        seed = self.rng.choice(list(removed)) if removed else self.rng.randrange(self.n)
+        for j in np.argsort(self.D[seed, :self.n]):
+            if len(removed) >= size:
+                break
+            if self.rng.random() < 0.7:
+                removed.add(int(j))
+        self.set_routes([[j for j in route if j not in removed] for route in self.routes])
+        return list(removed)
+
+    def repair(self, removed):
+        # Greedy min-max insertion of the removed items, biggest items first
+        self.rng.shuffle(removed)
+        removed.sort(key=lambda j: -self.s[j])
+        for j in removed:
+            best = None
+            for k in range(self.m):
+                if self.loads[k] + self.s[j] > self.l[k]:
+                    continue
+                nodes = self.cache[k][0]
+                delta = self.D[nodes[:-1], j] + self.D[j, nodes[1:]] - self.D[nodes[:-1], nodes[1:]]
+                q = int(np.argmin(delta))
+                key = (self.costs[k] + int(delta[q]), self.rng.random())
+                if best is None or key < best[0]:
+                    best = (key, k, q)
+            if best is None:
+                return False
+            _, k, q = best
+            self.apply({k: self.routes[k][:q] + [j] + self.routes[k][q:]})
+        return True
+
+    def run(self, timeout_duration, incumbent=None, lower_bound=0, max_iterations=None):
+        # max_iterations: stop after that many destroy and repair steps, which with a
+        # fixed seed and no binding timeout makes the run deterministic
+        deadline = time.time() + timeout_duration
+        self.local_search(deadline)
+        best_routes, best_key = [list(route) for route in self.routes], self.key()
+        current_key = best_key
+        iteration = 0
+        # Nothing left to improve once the lower bound is reached
+        while time.time() < deadline and best_key[0] > lower_bound:
+            if max_iterations is not None and iteration >= max_iterations:
+                break
+            iteration += 1
+            saved = [list(route) for route in self.routes]
+            size = self.rng.randint(2, max(2, min(self.n // 4, 30)))
+            removed = self.destroy(size)
+            if not self.repair(removed):
+                self.set_routes(saved)
+                continue
+            self.local_search(deadline)
+            key = self.key()
+            # Record-to-record travel: accept anything within 1% of the best solution
+            if key < current_key or key[0] <= best_key[0] * 1.01:
+                current_key = key
+            else:
+                self.set_routes(saved)
+            if key < best_key:
+                best_routes, best_key = [list(route) for route in self.routes], key
+                if incumbent is not None:
+                    incumbent.publish(best_key[0], to_routes(best_routes), 'lns')
+        return best_routes, best_key[0], iteration
+
+
+def lns(m, n, s, l, D, timeout_duration, initial_routes=None, seed=0, incumbent=None, lower_bound=0, verbose=False, max_iterations=None):
+    start_time = time.time()
+    D = np.asarray(D, dtype=np.int64)
+    routes = from_routes(initial_routes) if initial_routes is not None else initial_solution(m, n, s, l, D, start_time + timeout_duration)
+    if routes is None:
+        return ("N/A", timeout_duration, None)
+    engine = LNS(m, n, s, l, D, routes, seed=seed)
+    best_routes, _, iterations = engine.run(timeout_duration - (time.time() - start_time), incumbent, lower_bound, max_iterations)
+    if verbose:
+        print(f"LNS iterations: {iterations}")
+
+    sol = to_routes(best_routes)
+    _, _, violations, obj = evaluate_routes(pad_routes([sol], m), D, s, l)
+    assert not violations.any(), "LNS returned a routing exceeding the capacities"
+    return (int(obj[0]), time.time() - start_time, sol)
+
+
+def heuristic_upper_bound(m, n, s, l, D, timeout_duration, lower_bound=0, max_iterations=None):
+    # Objective and routes of a short LNS run, used as initial incumbent by the
+    # exact methods; (None, None) when no feasible routing is found
+    obj, _, sol = lns(m, n, s, l, D, timeout_duration, lower_bound=lower_bound, max_iterations=max_iterations)
+    return (None, None) if sol is None else (obj, sol)
@@ -0,0 +1,275 @@
+import math
+import time
+import heapq
+import numpy as np
+from bounds import lower_bound
+from preprocessing import capacity_classes
+from Models.LNS.lns import heuristic_upper_bound
+from .column_generation import make_initial_routes, calculate_route_cost, price_courier, NG_SIZE
+from .pricing import ng_neighbourhoods
+
+# Branch-and-price on the min-max set partitioning master of
+# set_partitioning.mod: every courier picks one route and MaxCourDist bounds the
+# length of all of them, so courier k prices its routes on the distances scaled
+# by the dual w[k] of its Route_Length row. Routes are lists of 1-based items,
+# couriers and nodes of the pricing graphs are 0-based, the depot is node n.
+# A node of the tree is a list of branching decisions, each one removing arcs
+# from the pricing graphs:
+#   ('arc', i, j, False): no courier uses i -> j
+#   ('arc', i, j, True): every courier leaving i goes to j and entering j comes from i
+#   ('class', c, i, False): no courier of capacity class c delivers item i
+#   ('class', c, i, True): no courier of another class delivers item i
+#   ('courier', k, i, False): courier k does not deliver item i
+#   ('courier', k, i, True): no other courier delivers item i
+# Branching on classes first keeps the tree from enumerating the swaps of
+# couriers of equal capacity.
+# Nodes are explored best bound first, the best routing found so far prunes them.
+
+EPSILON = 1e-6
+
+# Nodes between two solves of the restricted master with integer columns, and
+# time limit in seconds of each of them
+INTEGER_MASTER_INTERVAL = 10
+INTEGER_MASTER_TIMEOUT = 10
+
+
+class Master:
+    # Restricted master in AMPL: every route priced in any node is a column, the
+    # ones compatible with the decisions of the current node are ACTIVE
+    def __init__(self, m, n, D, solver_name, bound):
+        from amplpy import AMPL
+        self.ampl = AMPL()
+        self.ampl.read('./Models/MIP/set_partitioning.mod')
+        self.ampl.param['n'] = n
+        self.ampl.param['m'] = m
+        self.ampl.param['lb'] = bound
+        self.ampl.param['penalty'] = sum(max(row) for row in D)  # Longer than any route
+        self.solver_name = solver_name
+        self.columns = []  # columns[r - 1]: (courier, route, cost) of column r
+        self.ids = {}
+
+    def add(self, k, route, cost):
+        key = (k, tuple(route))
+        if key not in self.ids:
+            self.columns.append((k, route, cost))
+            r = len(self.columns)
+            self.ids[key] = r
+            self.ampl.param['nColumns'] = r
+            self.ampl.param['courier'][r] = k
+            self.ampl.param['cost'][r] = cost
+            self.ampl.set['ITEMS'][r] = route
+        return self.ids[key]
+
+    def solve(self, active, timeout, integer=False):
+        # Objective, values of the active columns and uncovered items
+        from mcp import set_mip_options
+        self.ampl.set['ACTIVE'] = active
+        self.ampl.setOption('relax_integrality', not integer)
+        set_mip_options(self.ampl, self.solver_name, max(1, math.ceil(timeout)))
+        self.ampl.solve()
+        z = self.ampl.getObjective('MaxDist').value()
+        x = {int(r): value for r, value in self.ampl.getData('{r in ACTIVE} x[r]').toList()}
+        uncovered = self.ampl.getValue('sum {i in V_no_depot} uncovered[i]')
+        return z, x, uncovered
+
+    def duals(self):
+        pi = [dual for _, dual in self.ampl.getData('{i in V_no_depot} Visit_Once[i].dual').toList()]
+        sigma = [dual for _, dual in self.ampl.getData('{k in K} One_Route[k].dual').toList()]
+        w = [-dual for _, dual in self.ampl.getData('{k in K} Route_Length[k].dual').toList()]
+        return pi, sigma, w
+
+
+def route_arcs(route, n):
+    nodes = [n] + [i - 1 for i in route] + [n]
+    return list(zip(nodes[:-1], nodes[1:]))
+
+
+def allowed_arcs(m, n, decisions, classes):
+    # allowed[k, i, j]: courier k may use the arc i -> j at the node
+    allowed = np.ones((m, n + 1, n + 1), dtype=bool)
+    courier_class = np.empty(m, dtype=np.int64)
+    for c, couriers in enumerate(classes):
+        courier_class[couriers] = c
+    for kind, a, b, value in decisions:
+        if kind == 'arc' and value:
+            i, j = a, b
+            kept = allowed[:, i, j].copy()
+            if i < n:
+                allowed[:, i, :] = False
+            if j < n:
+                allowed[:, :, j] = False
+            allowed[:, i, j] = kept
+        elif kind == 'arc':
+            allowed[:, a, b] = False
+        elif kind == 'class':
+            allowed[(courier_class != a) if value else (courier_class == a), :, b] = False
+        elif value:
+            allowed[np.arange(m) != a, :, b] = False
+        else:
+            allowed[a, :, b] = False
+    return allowed
+
+
+def branching_decision(master, x, n, classes):
+    # Most fractional arc flow, then most fractional assignment of an item to a
+    # capacity class and to a courier; None when all of them are integral
+    courier_class = {k: c for c, couriers in enumerate(classes) for k in couriers}
+    flow = {}
+    class_assignment = {}
+    assignment = {}
+    for r, value in x.items():
+        if value < EPSILON:
+            continue
+        k, route, _ = master.columns[r - 1]
+        for i, j in route_arcs(route, n):
+            if i < n or j < n:
+                flow[i, j] = flow.get((i, j), 0) + value
+        for i in route:
+            c = courier_class[k - 1]
+            class_assignment[c, i - 1] = class_assignment.get((c, i - 1), 0) + value
+            assignment[k - 1, i - 1] = assignment.get((k - 1, i - 1), 0) + value
+
+    for kind, values in [('arc', flow), ('class', class_assignment), ('courier', assignment)]:
+        fractional = {key: value for key, value in values.items() if EPSILON < value < 1 - EPSILON}
+        if fractional:
+            a, b = min(fractional, key=lambda key: abs(fractional[key] - 0.5))
+            return kind, a, b
+    return None
+
+
+def selected_routes(master, x, m):
+    # Routing of an integral master solution and its objective
+    routes = [[] for _ in range(m)]
+    obj = 0
+    for r, value in x.items():
+        if value > 0.5:
+            k, route, cost = master.columns[r - 1]
+            routes[k - 1] = route
+            obj = max(obj, cost)
+    return obj, routes
+
+
+def price_node(executor, master, allowed, s, l, distances, neighbourhoods, timeout):
+    # Routes of negative reduced cost of every courier on the duals of the
+    # master, and whether a pricing ran out of time
+    pi, sigma, w = master.duals()
+    args = [(np.where(allowed[k], w[k] * distances, np.inf), s, l[k], pi, sigma[k], neighbourhoods[k], timeout)
+            for k in range(len(l))]
+    if executor is None:
+        results = [price_courier(*arg) for arg in args]
+    else:
+        results = list(executor.map(price_courier, *zip(*args)))
+    for k, (_, grown, _) in enumerate(results):
+        neighbourhoods[k] = grown
+    return [routes for routes, _, _ in results], any(truncated for _, _, truncated in results)
+
+
+def solve_node(executor, master, active, allowed, s, l, D, distances, neighbourhoods, deadline):
+    # Column generation of a node: (LP value, column values, uncovered items,
+    # False when the time ran out before an untruncated pricing found no route)
+    n = len(s)
+    while True:
+        z, x, uncovered = master.solve(active, deadline - time.time())
+        if time.time() >= deadline:
+            return z, x, uncovered, False
+
+        added = 0
+        priced, truncated = price_node(executor, master, allowed, s, l, distances, neighbourhoods, deadline - time.time())
+        for k, routes in enumerate(priced):
+            for _, items in routes:
+                route = [i + 1 for i in items]
+                r = master.add(k + 1, route, calculate_route_cost(route, n, D))
+                if r not in active:
+                    active.append(r)
+                    added += 1
+        if not added:
+            # The LP value is only a bound of the node once the pricing is exact
+            return z, x, uncovered, not truncated
+
+
+def branch_and_price(m, n, s, l, D, solver_name, timeout_duration, jobs=None):
+    # Returns (objective, solving time, optimal, routes), or (None, ...) when
+    # no routing is found within the timeout
+    from concurrent.futures import ProcessPoolExecutor
+    import os
+    start_time = time.time()
+    deadline = start_time + timeout_duration
+    distances = np.asarray(D, dtype=np.float64)
+    bound = lower_bound(m, n, l, s, D)
+    master = Master(m, n, D, solver_name, bound)
+    classes = capacity_classes(l)
+
+    # Initial columns: the empty route, the greedy routes and the single items
+    # of every courier, and the routes of a short LNS run, also the incumbent
+    initial_routes, _, _ = make_initial_routes(n, l, s, D)
+    for k in range(1, m + 1):
+        master.add(k, [], 0)
+        for route in initial_routes[k]:
+            if sum(s[i - 1] for i in route) <= l[k - 1]:
+                master.add(k, route, calculate_route_cost(route, n, D))
+    best_obj, best_routes = heuristic_upper_bound(m, n, s, l, D, 1, bound)
+    if best_routes is not None:
+        for k, route in enumerate(best_routes, start=1):
+            master.add(k, route, calculate_route_cost(route, n, D))
+
+    neighbourhoods = [ng_neighbourhoods(distances, NG_SIZE) for _ in range(m)]
+    jobs = os.cpu_count() if jobs is None else jobs
+    executor = ProcessPoolExecutor(max_workers=min(jobs, m)) if jobs > 1 else None
+
+    heap = [(bound, 0, [])]
+    counter = 1
+    explored = 0
+    proven = True
+    try:
+        while heap and time.time() < deadline:
+            node_bound, _, decisions = heapq.heappop(heap)
+            if best_obj is not None and node_bound >= best_obj:
+                heap = []
+                break
+
+            allowed = allowed_arcs(m, n, decisions, classes)
+            active = [r for r, (k, route, _) in enumerate(master.columns, start=1)
+                      if all(allowed[k - 1][arc] for arc in route_arcs(route, n))]
+            z, x, uncovered, finished = solve_node(executor, master, active, allowed, s, l, D, distances, neighbourhoods, deadline)
+            explored += 1
+            if not finished:
+                proven = False
+                break
+            if uncovered > EPSILON:
+                continue  # No routing satisfies the decisions of the node
+
+            node_bound = max(node_bound, math.ceil(z - EPSILON))
+            print(f"Node {explored}: depth {len(decisions)}, LP {z:.2f}, bound {node_bound}, "
+                  f"{len(heap)} open, {len(master.columns)} columns, incumbent {best_obj}")
+            if best_obj is not None and node_bound >= best_obj:
+                continue
+
+            decision = branching_decision(master, x, n, classes)
+            if decision is None:
+                obj, routes = selected_routes(master, x, m)
+                if best_obj is None or obj < best_obj:
+                    best_obj, best_routes = obj, routes
+                    print(f"Improving solution: {best_obj} after {time.time() - start_time:.2f}s")
+                continue
+
+            # The integer program on the columns of the node may find a better routing
+            if explored % INTEGER_MASTER_INTERVAL == 1:
+                timeout = min(INTEGER_MASTER_TIMEOUT, deadline - time.time())
+                _, x, uncovered = master.solve(active, timeout, integer=True)
+                obj, routes = selected_routes(master, x, m)
+                if uncovered < EPSILON and (best_obj is None or obj < best_obj):
+                    best_obj, best_routes = obj, routes
+                    print(f"Improving solution: {best_obj} after {time.time() - start_time:.2f}s")
+
+            kind, a, b = decision
+            for value in [True, False]:
+                heapq.heappush(heap, (node_bound, counter, decisions + [(kind, a, b, value)]))
+                counter += 1
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    solving_time = time.time() - start_time
+    optimal = proven and not heap and time.time() < deadline
+    print(f"Branch-and-price: {explored} nodes, {len(master.columns)} columns")
+    return best_obj, solving_time, optimal, best_routes
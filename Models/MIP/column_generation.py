@@ -1,12 +1,22 @@
+from util import read_instances, pad_routes, evaluate_routes
+from preprocessing import capacity_classes
+from .pricing import price_routes, ng_neighbourhoods
+
+# Routes added per courier and pricing call, labels per node of the truncated
+# labelings tried in turn before the exact one, initial ng-neighbourhood size
+# and time limit in seconds of the exact labeling
+PRICING_ROUTES = 10
+PRICING_LABELS = [5, 50]
+NG_SIZE = 8
+EXACT_PRICING_TIMEOUT = 60
+
+# Rounds a priced column may stay at zero in the master before it leaves the pool
+MAX_COLUMN_AGE = 5
+
+
 def calculate_route_cost(route, n, D):
-    cost = 0
-    depot = n + 1
-    curr_node = depot
-    for next_node in route:
-        cost += D[curr_node - 1][next_node - 1]
-        curr_node = next_node
-    cost += D[curr_node - 1][depot - 1]
-    return cost
+    distances, _, _, _ = evaluate_routes(pad_routes([[route]]), D)
+    return int(distances[0][0])
 
 
 def make_initial_routes(n, capacities, s, D):
@@ -59,111 +69,196 @@ def extract_route(x, n):
     return route[1:]  # Remove depot from start and end
 
 
-def solve_with_column_generation(file_name, solver):
+def price_courier(D, s, capacity, pi, sigma, neighbourhoods, timeout=EXACT_PRICING_TIMEOUT):
+    # Truncated labelings first, the exact one only when they find no route.
+    # Returns the routes, the ng-neighbourhoods grown by the exact labeling,
+    # which are lost when the pricing runs in another process, and whether
+    # the exact labeling ran out of time: no route then proves nothing.
+    for max_labels in PRICING_LABELS:
+        routes, _ = price_routes(D, s, capacity, pi, sigma, max_routes=PRICING_ROUTES, max_labels=max_labels)
+        if routes:
+            return routes, neighbourhoods, False
+    routes, truncated = price_routes(D, s, capacity, pi, sigma, max_routes=PRICING_ROUTES, neighbourhoods=neighbourhoods,
+                                     timeout=timeout)
+    return routes, neighbourhoods, truncated
+
+
+def price_couriers(executor, D, s, c, pi, sigma, neighbourhoods, timeout=EXACT_PRICING_TIMEOUT):
+    # The pricing problems of all couriers for the same duals, in the process pool
+    # if any. Returns the routes of every courier and whether a pricing ran out of time.
+    m = len(c)
+    args = [(D, s, c[k - 1], pi, sigma[k - 1], neighbourhoods[k], timeout) for k in range(1, m + 1)]
+    if executor is None:
+        results = [price_courier(*arg) for arg in args]
+    else:
+        results = list(executor.map(price_courier, *zip(*args)))
+    for k, (_, grown, _) in enumerate(results, start=1):
+        neighbourhoods[k] = grown
+    truncated = any(truncated for _, _, truncated in results)
+    return {k: routes for k, (routes, _, _) in enumerate(results, start=1)}, truncated
+
+
+def master_duals(ampl_master):
+    pi = [dual for _, dual in ampl_master.getData('{i in V_no_depot} Visit_Once[i].dual').toList()]
+    sigma = [dual for _, dual in ampl_master.getData('{k in K} K_Couriers_Used[k].dual').toList()]
+    return pi, sigma
+
+
+def solve_with_column_generation(file_name, solver, jobs=None, smoothing=None):
+    # Returns the maximum distance and the routes (lists of 1-based items per
+    # courier) of the integer master on the columns generated for its LP
+    # relaxation, which minimizes the total distance.
+    # Round-based column generation: the master is solved once per round and all
+    # the couriers are priced on its duals, in parallel over jobs processes
+    # (default: number of cores, 1 prices in this process). Couriers of equal
+    # capacity are interchangeable, so the master has one row, and the rounds
+    # one pricing, per capacity class: below, k is a class and c its capacity.
+    # smoothing: Wentges smoothing factor in [0, 1), the couriers are priced on
+    # smoothing * center + (1 - smoothing) * duals, where the center is the
+    # last smoothed point that gave columns; when none of the routes found
+    # has a negative reduced cost on the duals, the round prices them again.
+    # A round whose exact pricing runs out of time without any column is
+    # priced again with twice the time, it never ends the column generation.
     from amplpy import AMPL
-    from minizinc import Model, Solver, Instance
-    import copy
-
-    m, n, c, s, D = read_instances(file_name)
+    from concurrent.futures import ProcessPoolExecutor
+    import os
+    import time
+
+    _, n, capacities, s, D = read_instances(file_name)
+    classes = capacity_classes(capacities)
+    m = len(classes)
+    c = [capacities[couriers[0]] for couriers in classes]
     ampl_master = AMPL()
     ampl_master.read('./Models/MIP/set_covering.mod')
     ampl_master.param['n'] = n
     ampl_master.param['m'] = m
+    ampl_master.param['count'] = {k: len(couriers) for k, couriers in enumerate(classes, start=1)}
 
-    initial_routes, initial_costs, initial_covers = make_initial_routes(n, c, s, D)
+    # Initial columns of a class: the greedy and single item routes of all its
+    # couriers, so that together they cover every item
+    courier_routes, _, _ = make_initial_routes(n, capacities, s, D)
+    initial_routes = {}
+    for k, couriers in enumerate(classes, start=1):
+        initial_routes[k] = []
+        for courier in couriers:
+            initial_routes[k] += [route for route in courier_routes[courier + 1] if route not in initial_routes[k]]
 
     route_indices = {}
+    costs = {}
     for k, route_list in initial_routes.items():
         route_indices[k] = list(range(1, len(route_list) + 1))
         ampl_master.set['R'][k] = route_indices[k]
-
-    for (k, r), value in initial_costs.items():
-        ampl_master.param['c'][k, r] = value
-
-    for (k, i, r), value in initial_covers.items():
-        ampl_master.param['a'][k, i, r] = value
+        for r, route in enumerate(route_list, start=1):
+            costs[k, r] = calculate_route_cost(route, n, D)
+            ampl_master.param['c'][k, r] = costs[k, r]
+            for i in range(1, n + 1):
+                ampl_master.param['a'][k, i, r] = 1 if i in route else 0
 
     ampl_master.setOption('solver', solver)
     ampl_master.setOption('relax_integrality', True)
 
-    # ampl_pricing = AMPL()
-    # ampl_pricing.read('./Models/MIP/pricing_problem.mod')
-    # ampl_pricing.param['n'] = n
-    # ampl_pricing.param['d'] = {(i + 1, j + 1): D[i][j] for i in range(n + 1) for j in range(n + 1)}
-    # ampl_pricing.param['s'] = {i + 1: s[i] for i in range(n)}
-
-    # ampl_pricing.setOption('solver', solver)
-    # ampl_pricing.setOption(f'{solver}_options', f'time_limit={30}')
-
-    mzn_pricing = Model("./Models/MIP/pricing_problem.mzn")
-    mzn_solver = Solver.lookup("gecode")
-    mzn_instance = Instance(mzn_solver, mzn_pricing)
-
-    finding_better_routes = True
-    while finding_better_routes:
-        finding_better_routes = False
-        for k in range(1, m + 1):
+    # ng-neighbourhoods of the exact pricing of every courier, grown across rounds
+    neighbourhoods = {k: ng_neighbourhoods(D, NG_SIZE) for k in range(1, m + 1)}
+    # Column pool: rounds spent non-basic by the priced columns, the initial ones
+    # always stay to keep the master feasible. An evicted column priced again
+    # gets back its index and is never evicted again, so the rounds cannot cycle.
+    ages = {k: {} for k in range(1, m + 1)}
+    evicted_routes = {k: {} for k in range(1, m + 1)}
+    center = None
+    pricing_timeout = EXACT_PRICING_TIMEOUT
+
+    jobs = os.cpu_count() if jobs is None else jobs
+    executor = ProcessPoolExecutor(max_workers=min(jobs, m)) if jobs > 1 else None
+    rounds = 0
+    try:
+        while True:
+            rounds += 1
+            start_time = time.time()
             ampl_master.solve()
-            dual_values = [ampl_master.getConstraint('Visit_Once').get(i).dual() for i in range(1, n + 1)]
-            dual_values.append(0)
-            dual_values_2 = [ampl_master.getConstraint('K_Couriers_Used').get(k).dual() for k in range(1, m + 1)]
-
-            mzn_instance = Instance(mzn_solver, mzn_pricing)
-            s2 = copy.deepcopy(s)
-            s2.append(0)
-            mzn_instance["n"] = n
-            mzn_instance["s"] = s2
-            mzn_instance["d"] = D
-            mzn_instance["C"] = c[k - 1]
-            mzn_instance["pi"] = dual_values
-            mzn_instance["sigma"] = dual_values_2[k-1]
-
-            result = mzn_instance.solve()
-            print(result)
-            reduced_cost = result["objective"]
-            print("Reduced cost:", reduced_cost)
-
-
-            # ampl_pricing.param['pi'] = {i+1: dual_values[i] for i in range(n + 1)}
-            # ampl_pricing.param['sigma'] = dual_values_2[k-1]
-            # ampl_pricing.param['C'] = c[k - 1]
-            # ampl_pricing.solve()
-
-            # reduced_cost = ampl_pricing.obj['MinReducedCost'].value()
-            # print("Reduced cost:", reduced_cost)
-
-            if reduced_cost <= -0.001:
-                finding_better_routes = True
-                new_route = [p for p in result["P"] if p != n+1]
-                initial_routes[k].append(new_route)
-                new_route_index = len(route_indices[k]) + 1
-                route_indices[k].append(new_route_index)
-                new_cost = calculate_route_cost(new_route, n, D)
-                print(f"Route: {new_route}, Cost: {new_cost}")
-
-                # new_route = []
-                # #x = ampl_pricing.var['x']
-                # #new_route = extract_route(x, n)
-                # initial_routes[k].append(new_route)
-                # new_route_index = len(route_indices[k]) + 1
-                # route_indices[k].append(new_route_index)
-                # new_cost = calculate_route_cost(new_route, n, D)
-                # print(f"New route: {new_route} with cost: {new_cost}")
-                ampl_master.set['R'][k] = route_indices[k]
-                ampl_master.param['c'][k, new_route_index] = new_cost
-                for i in range(1, n + 1):
-                    ampl_master.param['a'][k, i, new_route_index] = 1 if i in new_route else 0
+            pi, sigma = master_duals(ampl_master)
+            master_time = time.time() - start_time
+
+            # Aging and eviction of the columns that stay non-basic, with a
+            # positive reduced cost
+            evicted = 0
+            for k in range(1, m + 1):
+                for r in list(ages[k]):
+                    route = initial_routes[k][r - 1]
+                    reduced_cost = costs[k, r] - sum(pi[i - 1] for i in route) - sigma[k - 1]
+                    ages[k][r] = ages[k][r] + 1 if reduced_cost > 1e-6 else 0
+                    if ages[k][r] > MAX_COLUMN_AGE:
+                        del ages[k][r]
+                        route_indices[k].remove(r)
+                        evicted_routes[k][tuple(route)] = r
+                        evicted += 1
+            if evicted:
+                for k in range(1, m + 1):
+                    ampl_master.set['R'][k] = route_indices[k]
+
+            start_time = time.time()
+            if smoothing and center is not None:
+                smoothed = ([smoothing * a + (1 - smoothing) * b for a, b in zip(center[0], pi)],
+                            [smoothing * a + (1 - smoothing) * b for a, b in zip(center[1], sigma)])
+            else:
+                smoothed = (pi, sigma)
+            while True:
+                new_routes, truncated = price_couriers(executor, D, s, c, smoothed[0], smoothed[1], neighbourhoods, pricing_timeout)
+                # Only the routes of negative reduced cost on the duals of the master are columns
+                columns = {k: [[item + 1 for item in items] for _, items in routes] for k, routes in new_routes.items()}
+                columns = {k: [route for route in routes
+                               if calculate_route_cost(route, n, D) - sum(pi[i - 1] for i in route) - sigma[k - 1] < -1e-6]
+                           for k, routes in columns.items()}
+                if any(columns.values()) or smoothed == (pi, sigma):
+                    break
+                smoothed = (pi, sigma)  # Mispricing: the smoothed duals found no column
+            center = smoothed
+            pricing_time = time.time() - start_time
+
+            added = 0
+            for k, routes in columns.items():
+                for new_route in routes:
+                    added += 1
+                    if tuple(new_route) in evicted_routes[k]:
+                        route_indices[k].append(evicted_routes[k].pop(tuple(new_route)))
+                        continue
+                    initial_routes[k].append(new_route)
+                    new_route_index = len(initial_routes[k])
+                    route_indices[k].append(new_route_index)
+                    ages[k][new_route_index] = 0
+                    costs[k, new_route_index] = calculate_route_cost(new_route, n, D)
+                    ampl_master.param['c'][k, new_route_index] = costs[k, new_route_index]
+                    for i in range(1, n + 1):
+                        ampl_master.param['a'][k, i, new_route_index] = 1 if i in new_route else 0
+                if routes:
+                    ampl_master.set['R'][k] = route_indices[k]
+
+            pool = sum(len(indices) for indices in route_indices.values())
+            print(f"Round {rounds}: LP {ampl_master.getObjective('total').value()}, master {master_time:.2f}s, "
+                  f"pricing {pricing_time:.2f}s, {added} columns added, {evicted} evicted, {pool} in the pool")
+            if not added and truncated:
+                pricing_timeout *= 2
+                print(f"Pricing ran out of time, priced again within {pricing_timeout}s")
+            elif not added:
+                break
+    finally:
+        if executor is not None:
+            executor.shutdown()
 
+    # Integer master on the final pool: the routes of every class go to its
+    # couriers, an item covered twice stays only in its first route
+    lp_value = ampl_master.getObjective('total').value()
     ampl_master.setOption('relax_integrality', False)
     ampl_master.solve()
     x = ampl_master.var['x']
-    print(x.getValues())
+    routes = [[] for _ in capacities]
+    covered = set()
     for k in range(1, m + 1):
-        print(k)
-        for r in route_indices[k]:
-
-            if x[k, r].value() > 0.5:
-                print(x[k, r].value())
-                route = initial_routes[k][r - 1]
-                print(f"Route {route} is used with cost {ampl_master.param['c'][k, r]}.")
-
+        selected = [initial_routes[k][r - 1] for r in route_indices[k] if x[k, r].value() > 0.5]
+        for courier, route in zip(classes[k - 1], selected):
+            routes[courier] = [i for i in route if i not in covered]
+            covered.update(route)
+    _, _, _, objective = evaluate_routes(pad_routes([routes], len(capacities)), D)
+    obj = int(objective[0])
+    print(f"Column generation: {rounds} rounds, LP {lp_value}, integer master {ampl_master.getObjective('total').value()}, "
+          f"maximum distance {obj}")
+    return obj, routes
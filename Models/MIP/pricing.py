@@ -0,0 +1,197 @@
+import math
+import time
+import heapq
+import numpy as np
+
+# Pricing of the column generation: elementary shortest path with capacity
+# (ESPPRC) on the reduced costs rc[i][j] = D[i][j] - pi[i], by bounded
+# bidirectional labeling. Items are 0-based, the depot is node n of D.
+# Labels only remember the visited items of their ng-neighbourhood (ng-route
+# relaxation); the neighbourhoods grow whenever all the routes found repeat
+# an item, until some routes are elementary or none is left. Arcs of infinite
+# cost are never used.
+
+EPSILON = 1e-6
+
+
+class Label:
+    __slots__ = ('node', 'cost', 'load', 'memory', 'parent', 'alive')
+
+    def __init__(self, node, cost, load, memory, parent):
+        self.node = node
+        self.cost = cost  # Reduced cost of the arcs of the partial path
+        self.load = load
+        self.memory = memory  # Bitmask of the items the path cannot visit next
+        self.parent = parent
+        self.alive = True
+
+    def path(self):
+        # Items from the label back to the depot
+        nodes = []
+        label = self
+        while label.parent is not None:
+            nodes.append(label.node)
+            label = label.parent
+        return nodes
+
+
+def ng_neighbourhoods(D, size):
+    # ng-neighbourhood of every item: the item and its size - 1 closest items, as bitmasks
+    n = len(D) - 1
+    items = np.asarray(D, dtype=np.float64)[:n, :n]
+    closest = np.argsort(np.minimum(items, items.T), axis=1, kind='stable')
+    neighbourhoods = []
+    for i in range(n):
+        mask = 1 << i
+        for j in closest[i, :size].tolist():
+            mask |= 1 << j
+        neighbourhoods.append(mask)
+    return neighbourhoods
+
+
+def add_label(bucket, node, cost, load, memory, parent, max_labels):
+    # New label of the node, unless a label of the bucket dominates it (no more
+    # cost and load, a subset of its memory). The labels it dominates are
+    # dropped; with max_labels, only the cheapest ones are kept.
+    kept = []
+    for other in bucket:
+        if other.cost <= cost + EPSILON and other.load <= load and other.memory & ~memory == 0:
+            return None
+        if cost <= other.cost + EPSILON and load <= other.load and memory & ~other.memory == 0:
+            other.alive = False
+        else:
+            kept.append(other)
+    if max_labels is not None and len(kept) >= max_labels:
+        worst = max(kept, key=lambda other: other.cost)
+        if worst.cost <= cost:
+            bucket[:] = kept
+            return None
+        worst.alive = False
+        kept.remove(worst)
+    label = Label(node, cost, load, memory, parent)
+    kept.append(label)
+    bucket[:] = kept
+    return label
+
+
+def extend_labels(arc_cost, s, capacity, half, neighbourhoods, max_labels, deadline=None):
+    # Labels from the depot extended over arc_cost[v][w], in order of load, as
+    # long as their load is at most half of the capacity, or until the deadline
+    n = len(s)
+    buckets = [[] for _ in range(n + 1)]
+    start = Label(n, 0.0, 0, 0, None)
+    buckets[n].append(start)
+    heap = [(0, 0, start)]
+    counter = 1
+    while heap:
+        _, _, label = heapq.heappop(heap)
+        if not label.alive or label.load > half:
+            continue
+        if deadline is not None and time.time() > deadline:
+            break
+        costs = arc_cost[label.node]
+        for w in range(n):
+            load = label.load + s[w]
+            if load > capacity or label.memory >> w & 1 or costs[w] == math.inf:
+                continue
+            new = add_label(buckets[w], w, label.cost + costs[w], load, (label.memory & neighbourhoods[w]) | 1 << w, label, max_labels)
+            if new is not None:
+                heapq.heappush(heap, (load, counter, new))
+                counter += 1
+    return buckets
+
+
+def join_labels(forward, backward, rc, s, capacity, half, sigma):
+    # Forward paths to i followed by the arc i -> j and a backward path from j,
+    # where the forward path is the first to exceed half of the capacity, or j is
+    # the depot. Returns the routes of negative reduced cost in increasing
+    # reduced cost, as (reduced cost, forward label, backward label). The labels
+    # dropped by the ng-dominance are missing: the first route is not always
+    # the most negative elementary one.
+    n = len(rc) - 1
+    threshold = sigma - EPSILON
+    for bucket in backward:
+        bucket.sort(key=lambda label: label.cost)
+    backward[n] = [Label(n, 0.0, 0, 0, None)]  # The route goes back to the depot
+
+    joins = []
+    for i in range(n):
+        for f in forward[i]:
+            for j in range(n + 1):
+                if j == i or (j < n and f.load + s[j] <= half):
+                    continue
+                cost = f.cost + rc[i][j]
+                for b in backward[j]:
+                    if cost + b.cost >= threshold:
+                        break
+                    if f.load + b.load <= capacity and not f.memory & b.memory:
+                        joins.append((cost + b.cost - sigma, f, b))
+    joins.sort(key=lambda join: join[0])
+    return joins
+
+
+def best_routes(joins, max_routes, elementary=False):
+    # The max_routes best distinct routes of the joins, only the elementary ones if asked
+    routes = {}
+    for reduced_cost, f, b in joins:
+        route = tuple(reversed(f.path())) + tuple(b.path())
+        if route not in routes and not (elementary and len(set(route)) < len(route)):
+            routes[route] = reduced_cost
+            if len(routes) == max_routes:
+                break
+    return [(reduced_cost, list(route)) for route, reduced_cost in routes.items()]
+
+
+def repeated_cycles(route):
+    # (item, items visited between two visits of the item) of a non-elementary route
+    last = {}
+    for position, item in enumerate(route):
+        if item in last:
+            yield item, route[last[item] + 1:position]
+        last[item] = position
+
+
+def price_routes(D, s, capacity, pi, sigma, max_routes=10, ng_size=8, max_labels=None, neighbourhoods=None, timeout=None):
+    # Routes of reduced cost below zero for a courier of the given capacity, in
+    # increasing reduced cost but not always starting from the most negative
+    # elementary route (see join_labels): pi[i] is the dual of the covering row
+    # of item i, sigma the one of the courier row. Returns the (reduced cost, 0-based items) pairs of the
+    # routes and whether the search was truncated. With max_labels the search
+    # is a heuristic and always truncated, otherwise no route returned by an
+    # untruncated search means that no elementary route has a negative
+    # reduced cost.
+    # neighbourhoods: ng-neighbourhoods to start from, grown in place
+    # timeout: seconds after which the labels are no longer extended, the
+    # search is then truncated too
+    deadline = None if timeout is None else time.time() + timeout
+    D = np.asarray(D, dtype=np.float64)
+    duals = np.append(np.asarray(pi, dtype=np.float64), 0.0)
+    rc = D - duals[:, None]
+    forward_cost, backward_cost = rc.tolist(), rc.T.tolist()
+    s = [int(size) for size in s]
+    if max_labels is not None:
+        # Few labels per node: they remember every item, no route repeats one
+        neighbourhoods = [(1 << len(s)) - 1] * len(s)
+    elif neighbourhoods is None:
+        neighbourhoods = ng_neighbourhoods(D, ng_size)
+    half = capacity / 2
+
+    while True:
+        forward = extend_labels(forward_cost, s, capacity, half, neighbourhoods, max_labels, deadline)
+        backward = extend_labels(backward_cost, s, capacity, half, neighbourhoods, max_labels, deadline)
+        joins = join_labels(forward, backward, forward_cost, s, capacity, half, sigma)
+        truncated = max_labels is not None or (deadline is not None and time.time() > deadline)
+        elementary = best_routes(joins, max_routes, elementary=True)
+        if elementary or not joins:
+            return elementary, truncated
+
+        # Every route of negative reduced cost repeats an item: the items of the
+        # cycles of the best ones remember the repeated item from now on
+        changed = False
+        for _, route in best_routes(joins, max_routes):
+            for item, cycle in repeated_cycles(route):
+                for other in cycle:
+                    changed |= not neighbourhoods[other] >> item & 1
+                    neighbourhoods[other] |= 1 << item
+        if not changed or truncated:
+            return [], truncated
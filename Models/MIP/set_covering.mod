@@ -3,6 +3,7 @@ param m;
 set V_no_depot := {1..n};
 set K := {1..m};
 set R {K};
+param count {K} default 1;            # couriers of each capacity class
 
 param c {k in K, r in R[k]} >= 0;
 param a {k in K, V_no_depot, r in R[k]} binary;
@@ -15,4 +16,4 @@ s.t. Visit_Once {i in V_no_depot}:
 	sum {k in K, r in R[k]} a[k,i,r] * x[k,r] >= 1;
 
 s.t. K_Couriers_Used {k in K}:
-    sum {r in R[k]} x[k,r] = 1;
\ No newline at end of file
+    sum {r in R[k]} x[k,r] = count[k];
\ No newline at end of file
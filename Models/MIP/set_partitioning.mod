@@ -0,0 +1,30 @@
+param n integer > 0;
+param m integer > 0;
+param lb default 0;                   # lower bound on the maximum distance
+param penalty > 0;                    # cost of an item left uncovered by the columns of a node
+set V_no_depot := {1..n};
+set K := {1..m};
+
+# Routes priced so far; the branch-and-price driver adds them one by one
+param nColumns integer default 0;
+set COLUMNS := 1..nColumns;
+param courier {COLUMNS} in K;
+param cost {COLUMNS} >= 0;
+set ITEMS {COLUMNS} within V_no_depot;
+set ACTIVE within COLUMNS;            # routes allowed by the branching decisions of the node
+
+var x {ACTIVE} binary;
+var MaxCourDist >= lb;
+var uncovered {V_no_depot} >= 0;
+
+minimize MaxDist:
+    MaxCourDist + penalty * sum {i in V_no_depot} uncovered[i];
+
+s.t. Visit_Once {i in V_no_depot}:
+    sum {r in ACTIVE: i in ITEMS[r]} x[r] + uncovered[i] = 1;
+
+s.t. One_Route {k in K}:
+    sum {r in ACTIVE: courier[r] = k} x[r] = 1;
+
+s.t. Route_Length {k in K}:
+    sum {r in ACTIVE: courier[r] = k} cost[r] * x[r] <= MaxCourDist;
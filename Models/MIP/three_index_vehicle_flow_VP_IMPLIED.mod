@@ -0,0 +1,54 @@
+param n;
+param m;
+param depot := n+1;
+set V_no_depot := {1..n};                # set of items excluding the depot
+set V := {1..depot};                     # set of items (including depot)
+set K := {1..m};                         # set of couriers
+set A within {V, V} default {i in V, j in V: i != j}; # arcs kept by the preprocessing
+
+param s{V_no_depot};                     # size of each item
+param d{V, V};                           # distance between items
+param c{K};                              # capacity of each courier
+param lb default 0;                      # lower bound on the maximum distance
+
+var x{A, K} binary;                      # 1 if courier k travels from i to j, 0 otherwise
+var y{V, K} binary;                      # 1 if courier k visits i, 0 otherwise
+var u{V_no_depot, K} >= 1, <= n;         # auxiliary variables for subtour elimination
+var maxCourDist >= 0;                    # maximum distance travelled by any courier
+
+minimize MaxCourDist: maxCourDist;
+
+s.t. MaxCourDist_Lower_Bound:
+    maxCourDist >= lb;
+
+s.t. MaxCourDist_Def {k in K}:
+    sum {(i,j) in A} d[i,j] * x[i,j,k] <= maxCourDist;
+
+s.t. Visit_Once {i in V_no_depot}:
+    sum {k in K} y[i,k] = 1;
+
+s.t. Each_Courier_Leaves_Depot {k in K}:
+    y[depot, k] = 1;
+
+s.t. Flow_Conservation_In {i in V, k in K}:
+    sum {j in V: (i,j) in A} x[i,j,k] = y[i,k];
+
+s.t. Flow_Conservation_Out {i in V, k in K}:
+    sum {j in V: (j,i) in A} x[j,i,k] = y[i,k];
+
+s.t. Capacity_Restriction{k in K}:
+    sum{i in V_no_depot} s[i] * y[i, k] <= c[k];
+
+s.t. Subtour_Elimination {(i,j) in A, k in K: i != depot && j != depot}:
+    u[i,k] - u[j,k] + 1  <= n * (1 - x[i,j,k]);
+
+# Couriers of equal capacity are interchangeable: within each capacity class,
+# courier k delivers item j only if the previous courier of the class delivers
+# an item before j (value precedence)
+set PREV_IN_CLASS {k in K} := {k2 in K: k2 < k && c[k2] == c[k]};
+
+s.t. Symmetry_Breaking {k in K, j in V_no_depot: card(PREV_IN_CLASS[k]) > 0}:
+    y[j,k] <= sum{i in V_no_depot: i < j} y[i, max {k2 in PREV_IN_CLASS[k]} k2];
+
+s.t. Higher_Load_For_Higher_Capacity {k1 in K, k2 in K: k1 != k2 && c[k1] > c[k2]}:
+    sum{i in V_no_depot} s[i] * y[i,k1] >= sum{i in V_no_depot} s[i] * y[i,k2];
@@ -0,0 +1,50 @@
+param n;
+param m;
+param depot := n+1;
+set V_no_depot := {1..n};                # set of items excluding the depot
+set V := {1..depot};                     # set of items (including depot)
+set K := {1..m};                         # set of couriers
+set A within {V, V} default {i in V, j in V: i != j}; # arcs kept by the preprocessing
+
+param s{V_no_depot};                     # size of each item
+param d{V, V};                           # distance between items
+param c{K};                              # capacity of each courier
+param lb default 0;                      # lower bound on the maximum distance
+
+var x{A, K} binary;                      # 1 if courier k travels from i to j, 0 otherwise
+var y{V, K} binary;                      # 1 if courier k visits i, 0 otherwise
+var maxCourDist >= 0;                    # maximum distance travelled by any courier
+
+minimize MaxCourDist: maxCourDist;
+
+s.t. MaxCourDist_Lower_Bound:
+    maxCourDist >= lb;
+
+s.t. MaxCourDist_Def {k in K}:
+    sum {(i,j) in A} d[i,j] * x[i,j,k] <= maxCourDist;
+
+s.t. Visit_Once {i in V_no_depot}:
+    sum {k in K} y[i,k] = 1;
+
+s.t. Each_Courier_Leaves_Depot {k in K}:
+    y[depot, k] = 1;
+
+s.t. Flow_Conservation_In {i in V, k in K}:
+    sum {j in V: (i,j) in A} x[i,j,k] = y[i,k];
+
+s.t. Flow_Conservation_Out {i in V, k in K}:
+    sum {j in V: (j,i) in A} x[j,i,k] = y[i,k];
+
+s.t. Capacity_Restriction{k in K}:
+    sum{i in V_no_depot} s[i] * y[i, k] <= c[k];
+
+# Subtour elimination and capacity cuts, added by the row generation driver for the
+# item sets of the subtours found in the previous solutions instead of the MTZ rows
+param nCuts integer default 0;
+set CUT{1..nCuts} within V_no_depot;
+
+s.t. Subtour_Elimination {t in 1..nCuts, k in K}:
+    sum {(i,j) in A: i in CUT[t] && j in CUT[t]} x[i,j,k] <= card(CUT[t]) - 1;
+
+s.t. Capacity_Cut {t in 1..nCuts}:
+    sum {k in K, (i,j) in A: i in CUT[t] && j not in CUT[t]} x[i,j,k] >= ceil(sum {i in CUT[t]} s[i] / max {k in K} c[k]);
@@ -1,5 +1,8 @@
 from z3 import *
 from itertools import combinations
+from functools import lru_cache
+from .clause_store import ClauseStore
+import math
 
 # At most one encodings
 # Naive pairwise
@@ -19,6 +22,8 @@ def at_least_one_seq(bool_vars):
 def at_most_one_seq(bool_vars, name):
     constraints = []
     n = len(bool_vars)
+    if n <= 1:
+        return BoolVal(True)
     s = [Bool(f"s_{name}_{i}") for i in range(n - 1)]
     constraints.append(Or(Not(bool_vars[0]), s[0]))
     constraints.append(Or(Not(bool_vars[n-1]), Not(s[n-2])))
@@ -44,6 +49,59 @@ def at_most_one_he(bool_vars, name):
 def exactly_one_he(bool_vars, name):
     return And(at_most_one_he(bool_vars, name), at_least_one_he(bool_vars))
 
+# Commander: groups of 3 literals, each implying its commander, and at most one commander
+def at_most_one_cmd(bool_vars, name, group_size = 3):
+    if len(bool_vars) <= group_size + 1:
+        return at_most_one_np(bool_vars)
+    constraints, commanders = [], []
+    for g in range(0, len(bool_vars), group_size):
+        group = bool_vars[g:g + group_size]
+        if len(group) == 1:
+            commanders.append(group[0])
+            continue
+        c = Bool(f"cmd_{name}_{g // group_size}")
+        constraints.append(at_most_one_np(group))
+        constraints += [Or(Not(var), c) for var in group]
+        commanders.append(c)
+    constraints.append(at_most_one(commanders, name + "_"))
+    return And(constraints)
+
+def exactly_one_cmd(bool_vars, name):
+    return And(at_least_one_np(bool_vars), at_most_one_cmd(bool_vars, name))
+
+# Product: literals on a grid, each implying its row and its column, and at most one row and one column
+def at_most_one_prod(bool_vars, name):
+    n = len(bool_vars)
+    if n <= 4:
+        return at_most_one_np(bool_vars)
+    q = math.ceil(math.sqrt(n))
+    rows = [Bool(f"row_{name}_{a}") for a in range(math.ceil(n / q))]
+    cols = [Bool(f"col_{name}_{b}") for b in range(q)]
+    constraints = []
+    for idx, var in enumerate(bool_vars):
+        constraints.append(Or(Not(var), rows[idx // q]))
+        constraints.append(Or(Not(var), cols[idx % q]))
+    constraints.append(at_most_one(rows, name + "_r"))
+    constraints.append(at_most_one(cols, name + "_c"))
+    return And(constraints)
+
+def exactly_one_prod(bool_vars, name):
+    return And(at_least_one_np(bool_vars), at_most_one_prod(bool_vars, name))
+
+# Bimander: pairs of literals, pairwise inside a pair, each literal implying the binary code of its pair
+def at_most_one_bim(bool_vars, name, group_size = 2):
+    groups = [bool_vars[g:g + group_size] for g in range(0, len(bool_vars), group_size)]
+    bits = [Bool(f"bim_{name}_{b}") for b in range((len(groups) - 1).bit_length())]
+    constraints = []
+    for h, group in enumerate(groups):
+        constraints.append(at_most_one_np(group))
+        for var in group:
+            constraints += [Or(Not(var), bit if (h >> b) & 1 else Not(bit)) for b, bit in enumerate(bits)]
+    return And(constraints)
+
+def exactly_one_bim(bool_vars, name):
+    return And(at_least_one_np(bool_vars), at_most_one_bim(bool_vars, name))
+
 # At most k encodings 
 # Sequential
 def at_least_k_seq(bool_vars, k, name):
@@ -68,5 +126,121 @@ def at_most_k_seq(bool_vars, k, name):
 def exactly_k_seq(bool_vars, k, name):
     return And(at_most_k_seq(bool_vars, k, name), at_least_k_seq(bool_vars, k, name))    
 
-exactly_one = exactly_one_seq
-at_least_one = at_least_one_seq
\ No newline at end of file
+AMO_ENCODINGS = {
+    'pairwise': at_most_one_np,
+    'sequential': at_most_one_seq,
+    'heule': at_most_one_he,
+    'commander': at_most_one_cmd,
+    'product': at_most_one_prod,
+    'bimander': at_most_one_bim
+}
+
+def at_most_one(bool_vars, name, encoding = None):
+    if encoding is None:
+        encoding = select_amo_encoding(len(bool_vars))
+    return AMO_ENCODINGS[encoding](bool_vars, name)
+
+def exactly_one(bool_vars, name, encoding = None):
+    return And(at_least_one_np(bool_vars), at_most_one(bool_vars, name, encoding))
+
+at_least_one = at_least_one_seq
+
+
+# Encodings over the integer literals of a ClauseStore, the clauses are added to
+# the store and hold only when the guard literal is true
+def at_least_one_cnf(store, lits, guard = None):
+    store.add(lits, guard)
+
+def at_most_one_seq_cnf(store, lits, guard = None):
+    n = len(lits)
+    if n <= 1:
+        return
+    s = [store.new_var() for _ in range(n - 1)]
+    store.add([-lits[0], s[0]], guard)
+    store.add([-lits[n-1], -s[n-2]], guard)
+    for i in range(1, n - 1):
+        store.add([-lits[i], s[i]], guard)
+        store.add([-lits[i], -s[i-1]], guard)
+        store.add([-s[i-1], s[i]], guard)
+
+def at_most_one_np_cnf(store, lits, guard = None):
+    for a, b in combinations(lits, 2):
+        store.add([-a, -b], guard)
+
+def at_most_one_he_cnf(store, lits, guard = None):
+    while len(lits) > 4:
+        y = store.new_var()
+        at_most_one_np_cnf(store, lits[:3] + [y], guard)
+        lits = lits[3:] + [-y]
+    at_most_one_np_cnf(store, lits, guard)
+
+def at_most_one_cmd_cnf(store, lits, guard = None, group_size = 3):
+    if len(lits) <= group_size + 1:
+        at_most_one_np_cnf(store, lits, guard)
+        return
+    commanders = []
+    for g in range(0, len(lits), group_size):
+        group = lits[g:g + group_size]
+        if len(group) == 1:
+            commanders.append(group[0])
+            continue
+        c = store.new_var()
+        at_most_one_np_cnf(store, group, guard)
+        for lit in group:
+            store.add([-lit, c], guard)
+        commanders.append(c)
+    at_most_one_cnf(store, commanders, guard)
+
+def at_most_one_prod_cnf(store, lits, guard = None):
+    n = len(lits)
+    if n <= 4:
+        at_most_one_np_cnf(store, lits, guard)
+        return
+    q = math.ceil(math.sqrt(n))
+    rows = [store.new_var() for _ in range(math.ceil(n / q))]
+    cols = [store.new_var() for _ in range(q)]
+    for idx, lit in enumerate(lits):
+        store.add([-lit, rows[idx // q]], guard)
+        store.add([-lit, cols[idx % q]], guard)
+    at_most_one_cnf(store, rows, guard)
+    at_most_one_cnf(store, cols, guard)
+
+def at_most_one_bim_cnf(store, lits, guard = None, group_size = 2):
+    groups = [lits[g:g + group_size] for g in range(0, len(lits), group_size)]
+    bits = [store.new_var() for _ in range((len(groups) - 1).bit_length())]
+    for h, group in enumerate(groups):
+        at_most_one_np_cnf(store, group, guard)
+        for lit in group:
+            for b, bit in enumerate(bits):
+                store.add([-lit, bit if (h >> b) & 1 else -bit], guard)
+
+AMO_ENCODINGS_CNF = {
+    'pairwise': at_most_one_np_cnf,
+    'sequential': at_most_one_seq_cnf,
+    'heule': at_most_one_he_cnf,
+    'commander': at_most_one_cmd_cnf,
+    'product': at_most_one_prod_cnf,
+    'bimander': at_most_one_bim_cnf
+}
+
+@lru_cache(maxsize = None)
+def select_amo_encoding(n):
+    # Encoding of an at-most-one over n literals with the fewest auxiliary
+    # variables plus clauses, measured by encoding n fresh literals once. The
+    # recursive encodings pick the encoding of their commanders the same way.
+    sizes = {'pairwise': n * (n - 1) // 2}  # No auxiliary variables, not worth encoding
+    for encoding, encode in AMO_ENCODINGS_CNF.items():
+        if encoding not in sizes:
+            store = ClauseStore()
+            encode(store, [store.new_var() for _ in range(n)])
+            sizes[encoding] = store.num_vars - n + store.num_clauses
+    return min(sizes, key = sizes.get)
+
+def at_most_one_cnf(store, lits, guard = None, encoding = None):
+    if encoding is None:
+        encoding = select_amo_encoding(len(lits))
+    AMO_ENCODINGS_CNF[encoding](store, lits, guard)
+
+def exactly_one_cnf(store, lits, guard = None, encoding = None):
+    at_least_one_cnf(store, lits, guard)
+    at_most_one_cnf(store, lits, guard, encoding)
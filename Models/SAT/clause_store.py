@@ -0,0 +1,76 @@
+from array import array
+
+
+class ClauseStore:
+    # CNF over integer literals: variables are numbered from 1, a literal is +v
+    # or -v, and the clauses are stored back to back in one array, each one
+    # terminated by 0 as in DIMACS. Only the variables of the model are named,
+    # the auxiliary variables of the encoders stay anonymous.
+    def __init__(self):
+        self.names = [None]  # names[v]: name of variable v, None when auxiliary
+        self.clauses = array('i')
+        self.num_clauses = 0
+
+    @property
+    def num_vars(self):
+        return len(self.names) - 1
+
+    def new_var(self, name=None):
+        self.names.append(name)
+        return len(self.names) - 1
+
+    def add(self, clause, guard=None):
+        # guard: the clause only has to hold when the guard literal is true
+        if guard is not None:
+            self.clauses.append(-guard)
+        self.clauses.extend(clause)
+        self.clauses.append(0)
+        self.num_clauses += 1
+
+    def clause_list(self):
+        # Clauses as lists of literals, e.g. for external SAT solvers
+        result, clause = [], []
+        for lit in self.clauses:
+            if lit == 0:
+                result.append(clause)
+                clause = []
+            else:
+                clause.append(lit)
+        return result
+
+    def to_dimacs(self):
+        lines = [f"c {v} {name}" for v, name in enumerate(self.names) if name is not None]
+        lines.append(f"p cnf {self.num_vars} {self.num_clauses}")
+        lines.extend(' '.join(map(str, clause + [0])) for clause in self.clause_list())
+        return '\n'.join(lines) + '\n'
+
+    def smt2_chunks(self, size=50000):
+        # SMT-LIB declarations of every variable, then the clauses size at a time.
+        # Named variables keep their name, so Bool(name) refers to the same constant.
+        symbols = [f"|{name}|" if name is not None else f"|cnf!{v}|" for v, name in enumerate(self.names)]
+        yield '\n'.join(f"(declare-const {symbol} Bool)" for symbol in symbols[1:])
+
+        lines, clause = [], []
+        for lit in self.clauses:
+            if lit == 0:
+                lines.append(f"(assert (or false {' '.join(clause)}))")
+                clause = []
+                if len(lines) == size:
+                    yield '\n'.join(lines)
+                    lines = []
+            else:
+                clause.append(symbols[lit] if lit > 0 else f"(not {symbols[-lit]})")
+        yield '\n'.join(lines)
+
+    def to_smt2(self):
+        return '\n'.join(self.smt2_chunks())
+
+    def to_z3(self, solver=None):
+        # Loads the clauses in bulk through the SMT-LIB parser of Z3, one chunk at a
+        # time so that the text of the whole formula is never held in memory
+        from z3 import Solver
+        if solver is None:
+            solver = Solver()
+        for chunk in self.smt2_chunks():
+            solver.from_string(chunk)
+        return solver
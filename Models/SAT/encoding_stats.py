@@ -0,0 +1,115 @@
+import sys
+import time
+import argparse
+import tracemalloc
+from z3 import *
+from util import read_instances
+from campaign import parse_instances
+from preprocessing import heuristic_arcs
+from Models.SAT.sat_model import build_sat_model, build_sat_cnf
+
+# Size and encoding time of the SAT model, run from the root of the repository:
+# python -m Models.SAT.encoding_stats --instances 1-21 --positions onehot binary
+# python -m Models.SAT.encoding_stats --instances 7-21 --builders z3 clauses --memory --skip-cnf
+# python -m Models.SAT.encoding_stats --instances 11-21 --builders clauses --amo sequential auto --skip-cnf
+# The builders are compared on the same arcs, 'clauses' includes loading the
+# clause store into Z3. The memory is the peak of the Python allocations plus
+# the growth of the Z3 heap.
+
+
+def count_clauses(solver):
+    # Same tactics used to write the DIMACS file
+    goal = Goal()
+    goal.add(solver.assertions())
+    cnf = Then(Tactic('simplify'), Tactic('bit-blast'), Tactic('tseitin-cnf')).apply(goal)
+    return sum(len(subgoal) for subgoal in cnf)
+
+
+def z3_memory():
+    return Z3_get_estimated_alloc_size()
+
+
+def build(m, n, l, s, D, arcs, position_encoding, builder, symmetry_breaking=False, amo_encoding=None):
+    # The solver, and the number of auxiliary variables when they are known ('clauses')
+    if builder == 'z3':
+        solver, _, _ = build_sat_model(m, n, s, l, D, symmetry_breaking, implied_constraint=True, arcs=arcs,
+                                       position_encoding=position_encoding, amo_encoding=amo_encoding)
+        aux = None
+    elif builder == 'clauses':
+        store, _, _ = build_sat_cnf(m, n, s, l, D, symmetry_breaking, implied_constraint=True, arcs=arcs,
+                                    position_encoding=position_encoding, amo_encoding=amo_encoding)
+        solver = store.to_z3()
+        aux = store.names.count(None) - 1
+    else:
+        raise ValueError(f"Unknown builder: {builder}")
+    return solver, aux
+
+
+def encoding_stats(file_name, position_encoding, cnf=True, builder='z3', arcs=None, memory=False, symmetry_breaking=False, amo_encoding=None):
+    m, n, l, s, D = read_instances(file_name)
+    if arcs is None:
+        arcs = heuristic_arcs(m, n, l, s, D)
+
+    start_time = time.time()
+    solver, aux = build(m, n, l, s, D, arcs, position_encoding, builder, symmetry_breaking, amo_encoding)
+    encoding_time = time.time() - start_time
+
+    # Tracing the allocations slows the encoding down, so it is measured apart
+    peak_memory = None
+    if memory:
+        z3_start = Z3_get_estimated_alloc_size()
+        tracemalloc.start()
+        build(m, n, l, s, D, arcs, position_encoding, builder, symmetry_breaking, amo_encoding)
+        _, python_memory = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        peak_memory = python_memory + max(0, Z3_get_estimated_alloc_size() - z3_start)
+
+    return {
+        "n": n,
+        "m": m,
+        "arcs": int(arcs.sum()),
+        "aux": aux,
+        "assertions": len(solver.assertions()),
+        "clauses": count_clauses(solver) if cnf else None,
+        "encoding_time": encoding_time,
+        "memory": peak_memory
+    }
+
+
+def main(args):
+    parser = argparse.ArgumentParser(description='Report the size and encoding time of the SAT model.')
+    parser.add_argument('--instances', type=parse_instances, default=parse_instances('1-10'),
+                        help="Instances to encode, e.g. '1-10,13' (default: 1-10)")
+    parser.add_argument('--positions', nargs='+', default=['onehot', 'binary'],
+                        help='Position encodings to compare (default: onehot binary)')
+    parser.add_argument('--builders', nargs='+', default=['z3'],
+                        help="Builders to compare, 'z3' expressions or 'clauses' (default: z3)")
+    parser.add_argument('--memory', action='store_true',
+                        help='Encode every model a second time to measure its memory')
+    parser.add_argument('--amo', nargs='+', default=['auto'],
+                        help="At-most-one encodings to compare, 'auto' picks one per group size (default: auto)")
+    parser.add_argument('--symmetry-breaking', action='store_true',
+                        help='Break the symmetries between couriers of equal capacity')
+    parser.add_argument('--skip-cnf', action='store_true',
+                        help='Do not convert the model to CNF to count the clauses')
+    options = parser.parse_args(args)
+
+    print(f"{'instance':>8} {'positions':>9} {'builder':>8} {'amo':>10} {'n':>4} {'m':>3} {'arcs':>6} {'aux':>8} {'assertions':>10} {'clauses':>10} {'time':>8} {'MB':>8}")
+    for instance in options.instances:
+        file_name = f'./Instances/inst{instance:02d}.dat'
+        m, n, l, s, D = read_instances(file_name)
+        arcs = heuristic_arcs(m, n, l, s, D)
+        for position_encoding in options.positions:
+            for builder in options.builders:
+                for amo in options.amo:
+                    stats = encoding_stats(file_name, position_encoding, not options.skip_cnf, builder, arcs, options.memory,
+                                           options.symmetry_breaking, None if amo == 'auto' else amo)
+                    aux = '-' if stats["aux"] is None else stats["aux"]
+                    clauses = '-' if stats["clauses"] is None else stats["clauses"]
+                    memory = '-' if stats["memory"] is None else f"{stats['memory'] / 2**20:.1f}"
+                    print(f"{instance:>8} {position_encoding:>9} {builder:>8} {amo:>10} {stats['n']:>4} {stats['m']:>3} {stats['arcs']:>6} "
+                          f"{aux:>8} {stats['assertions']:>10} {clauses:>10} {stats['encoding_time']:>8.2f} {memory:>8}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
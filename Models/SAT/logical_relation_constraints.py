@@ -11,6 +11,17 @@ def successor(v, u):
 
     return And(clauses)
 
+def binary_successor(v, u):
+    # u = v + 1 on little-endian bit vectors, without overflow
+    clauses = []
+    carry = BoolVal(True)
+    for i in range(len(v)):
+        clauses.append(u[i] == Xor(v[i], carry))
+        carry = And(v[i], carry)
+    clauses.append(Not(carry))
+
+    return And(clauses)
+
 def same_load_constraint(v1, v2):
     assert(len(v1) == len(v2))
     return And([v1[k] == v2[k] for k in range(len(v1))])
@@ -37,4 +48,70 @@ def lex_less_equal(v1, v2):
             constraints.append(Implies(And([v1[j] == v2[j] for j in range(i)]), Or(Not(v1[i]), v2[i])))
     
     return And(constraints)
-    
\ No newline at end of file
+
+def value_precedence(x, name):
+    # x[t][j]: courier t of a class of interchangeable couriers delivers item j.
+    # Item j goes to courier t + 1 only if courier t delivers an item before j,
+    # with used[t][j] implying that courier t delivers one of the items 0..j.
+    # 2 clauses per courier and item.
+    n = len(x[0])
+    used = [[Bool(f"{name}_used_{t}_{j}") for j in range(n)] for t in range(len(x) - 1)]
+    clauses = []
+    for t in range(len(x) - 1):
+        clauses.append(Not(x[t + 1][0]))
+        clauses.append(Implies(used[t][0], x[t][0]))
+        for j in range(1, n):
+            clauses.append(Implies(x[t + 1][j], used[t][j - 1]))
+            clauses.append(Implies(used[t][j], Or(used[t][j - 1], x[t][j])))
+    return And(clauses)
+
+# Encodings over the integer literals of a ClauseStore, the clauses are added to
+# the store and hold only when the guard literal is true
+def equal_cnf(store, a, b, guard = None):
+    store.add([-a, b], guard)
+    store.add([a, -b], guard)
+
+def successor_cnf(store, v, u, guard = None):
+    n = len(v)
+    store.add([-u[0]], guard)
+    for i in range(n-1):
+        equal_cnf(store, v[i], u[i+1], guard)
+    store.add([-v[n-1]], guard)
+
+def binary_successor_cnf(store, v, u, guard = None):
+    # u = v + 1 on little-endian bit vectors, without overflow. carry[i] is the
+    # carry into bit i, defined whatever the guard
+    carry = [None]
+    for i in range(len(v) - 1):
+        c = store.new_var()
+        if carry[i] is None:
+            equal_cnf(store, c, v[i])
+        else:
+            store.add([-c, v[i]])
+            store.add([-c, carry[i]])
+            store.add([c, -v[i], -carry[i]])
+        carry.append(c)
+
+    for i in range(len(v)):
+        if carry[i] is None:
+            # u[i] = not v[i]
+            store.add([u[i], v[i]], guard)
+            store.add([-u[i], -v[i]], guard)
+        else:
+            # u[i] = v[i] xor carry[i]
+            store.add([-u[i], v[i], carry[i]], guard)
+            store.add([-u[i], -v[i], -carry[i]], guard)
+            store.add([u[i], -v[i], carry[i]], guard)
+            store.add([u[i], v[i], -carry[i]], guard)
+    # No overflow out of the most significant bit
+    store.add([-v[-1]] + ([] if carry[-1] is None else [-carry[-1]]), guard)
+
+def value_precedence_cnf(store, x):
+    n = len(x[0])
+    for t in range(len(x) - 1):
+        used = [store.new_var() for _ in range(n)]
+        store.add([-x[t + 1][0]])
+        store.add([-used[0], x[t][0]])
+        for j in range(1, n):
+            store.add([-x[t + 1][j], used[j - 1]])
+            store.add([-used[j], used[j - 1], x[t][j]])
@@ -0,0 +1,74 @@
+import sys
+import time
+import argparse
+from z3 import *
+from util import read_instances
+from campaign import parse_instances
+from Models.SAT.pseudoboolean_constraints import PB_ENCODERS, Pb_encode, select_pb_encoder
+
+# Size and encoding time of the capacity constraints for every PB encoder, run
+# from the root of the repository:
+# python -m Models.SAT.pb_benchmark --instances 1-10
+
+
+def flatten(constraints):
+    clauses = []
+    for constraint in constraints:
+        if is_and(constraint):
+            clauses.extend(flatten(constraint.children()))
+        else:
+            clauses.append(constraint)
+    return clauses
+
+
+def count_auxiliary_variables(clauses):
+    # Variables introduced by the encoder, the assignment variables x are excluded
+    variables = set()
+    stack = list(clauses)
+    while stack:
+        expr = stack.pop()
+        if is_const(expr) and expr.decl().kind() == Z3_OP_UNINTERPRETED:
+            if not expr.decl().name().startswith('x_'):
+                variables.add(expr.decl().name())
+        else:
+            stack.extend(expr.children())
+    return len(variables)
+
+
+def capacity_stats(m, n, l, s, encoder):
+    x = [[Bool(f"x_{i}_{j}") for j in range(n)] for i in range(m)]
+    start_time = time.time()
+    constraints = []
+    for i in range(m):
+        constraints.extend(Pb_encode(x[i], s, l[i], f"load_courier_{i}", encoder))
+    encoding_time = time.time() - start_time
+
+    clauses = flatten(constraints)
+    return {
+        "variables": count_auxiliary_variables(clauses),
+        "clauses": len(clauses),
+        "encoding_time": encoding_time
+    }
+
+
+def main(args):
+    parser = argparse.ArgumentParser(description='Compare the PB encodings of the capacity constraints.')
+    parser.add_argument('--instances', type=parse_instances, default=parse_instances('1-10'),
+                        help="Instances to encode, e.g. '1-10,13' (default: 1-10)")
+    parser.add_argument('--encoders', nargs='+', default=list(PB_ENCODERS) + ['auto'],
+                        help="Encoders to compare, 'auto' picks one per constraint (default: all)")
+    options = parser.parse_args(args)
+
+    print(f"{'instance':>8} {'encoder':>22} {'variables':>10} {'clauses':>10} {'time':>8}")
+    for instance in options.instances:
+        m, n, l, s, D = read_instances(f'./Instances/inst{instance:02d}.dat')
+        x = [Bool(f"x_{j}") for j in range(n)]
+        selected = sorted(set(select_pb_encoder(x, s, l[i]) if sum(s) > l[i] else 'none' for i in range(m)))
+        print(f"inst{instance:02d}: n={n}, m={m}, selected: {', '.join(selected)}")
+        for encoder in options.encoders:
+            stats = capacity_stats(m, n, l, s, None if encoder == 'auto' else encoder)
+            print(f"{instance:>8} {encoder:>22} {stats['variables']:>10} {stats['clauses']:>10} {stats['encoding_time']:>8.2f}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -21,13 +21,13 @@ def num_to_bits(n, num):
     bits.reverse()
     return bits
 
-def normal_form(lits, coeffs, rhs):
+def normal_form(lits, coeffs, rhs, negate = Not):
     assert(len(lits) == len(coeffs))
     simplified_lits = [] 
     simplified_coeffs = []
 
-    simplified_lits = lits.copy()
-    simplified_coeffs = coeffs.copy()
+    simplified_lits = list(lits)
+    simplified_coeffs = list(coeffs)
 
     # Greater-than constraints are changed into less-than constraints by negating all constants
     # simplified_coeffs = [-1 * i for i in simplified_coeffs]
@@ -36,10 +36,13 @@ def normal_form(lits, coeffs, rhs):
     # Negative coefficients are eliminated by changing p into Not(p) and updating the RHS
     for i in range(len(simplified_coeffs)):
         if simplified_coeffs[i] < 0:
-            simplified_lits[i] = Not(simplified_lits[i])
+            simplified_lits[i] = negate(simplified_lits[i])
             simplified_coeffs[i] = -1 * simplified_coeffs[i]
             rhs += simplified_coeffs[i]
 
+    if len(simplified_lits) == 0:
+        return [], [], rhs
+
     # The coefficients are sorted in ascending order
     combined = list(zip(simplified_coeffs, simplified_lits))
     combined.sort(key=lambda x: x[0])
@@ -48,10 +51,11 @@ def normal_form(lits, coeffs, rhs):
     simplified_coeffs = list(simplified_coeffs)
     simplified_lits = list(simplified_lits)
     
-    # Coefficients greater than the RHS are trimmed to (replaced with) the RHS
+    # Coefficients greater than the RHS are trimmed to (replaced with) RHS + 1,
+    # the literal still cannot be true on its own
     for i in range(len(simplified_coeffs)):
         if simplified_coeffs[i] > rhs:
-             simplified_coeffs[i] = rhs
+             simplified_coeffs[i] = rhs + 1
 
     # The coefficients of the LHS are divided by their greatest common divisor (“gcd”)
     # The RHS is replaced by “RHS/gcd”, rounded upwards
@@ -82,8 +86,11 @@ def encode(lits, coeffs, rhs):
     
 def Pb_seq_counter(bool_vars, coeffs, k, name):    
     bool_vars, coeffs, k = normal_form(bool_vars, coeffs, k)
+    # Literals heavier than k are false
+    bool_vars, coeffs, constraints = encode(bool_vars, coeffs, k)
+    if len(bool_vars) == 0:
+        return constraints
     
-    constraints = []
     n = len(bool_vars)
     seq_auxiliary = [[Bool(f"s_{name}_{i}_{j}") for j in range(k + 1)] for i in range(n + 1)]
     for i in range(1, n + 1):
@@ -167,7 +174,7 @@ def Pb_adder_networks(bool_vars, coeffs, k):
         formula.append(Or(xc, xs, Not(c)))
 
     def fa_carry(a, b, c):
-        x = Bool(f"carry_{a}_{b}_{c}")
+        x = FreshBool("carry")
         formula.append(Or(b, c, Not(x)))
         formula.append(Or(a, c, Not(x)))
         formula.append(Or(a, b, Not(x)))
@@ -177,7 +184,7 @@ def Pb_adder_networks(bool_vars, coeffs, k):
         return x
 
     def fa_sum(a, b, c):
-        x = Bool(f"sum_{a}_{b}_{c}")
+        x = FreshBool("sum")
         formula.append(Or(a, b, c, Not(x)))
         formula.append(Or(a, Not(b), Not(c), Not(x)))
         formula.append(Or(Not(a), b, Not(c), Not(x)))
@@ -189,14 +196,14 @@ def Pb_adder_networks(bool_vars, coeffs, k):
         return x
 
     def ha_carry(a, b):
-        x = Bool(f"carry_{a}_{b}")
+        x = FreshBool("carry")
         formula.append(Or(a, Not(x)))
         formula.append(Or(b, Not(x)))
         formula.append(Or(Not(a), Not(b), x))
         return x
 
     def ha_sum(a, b):
-        x = Bool(f"sum_{a}_{b}")
+        x = FreshBool("sum")
         formula.append(Or(Not(a), Not(b), Not(x)))
         formula.append(Or(a, b, Not(x)))
         formula.append(Or(Not(a), b, x))
@@ -204,9 +211,12 @@ def Pb_adder_networks(bool_vars, coeffs, k):
         return x
 
     bool_vars, coeffs, k = normal_form(bool_vars, coeffs, k)
+    # Literals heavier than k are false
+    bool_vars, coeffs, formula = encode(bool_vars, coeffs, k)
+    if len(bool_vars) == 0 or k == 0:
+        return formula
 
     result = []
-    formula = []
     buckets = []
     nb = ld_int(k)
     for iBit in range(nb):
@@ -221,3 +231,370 @@ def Pb_adder_networks(bool_vars, coeffs, k):
     constraints = less_than_or_equal(result, kBits)
     formula.extend(constraints)
     return formula
+
+def Pb_generalized_totalizer(bool_vars, coeffs, k, name):
+    bool_vars, coeffs, k = normal_form(bool_vars, coeffs, k)
+
+    # Every node of the tree maps each partial sum it can reach, capped at k + 1,
+    # to a literal that is true when the sum of its leaves reaches that value
+    constraints = []
+    nodes = [{wi: xi} for xi, wi in zip(bool_vars, coeffs)]
+    counter = 0
+    while len(nodes) > 1:
+        merged = []
+        for a, b in zip(nodes[0::2], nodes[1::2]):
+            sums = {}
+            for wa, xa in [(0, None)] + list(a.items()):
+                for wb, xb in [(0, None)] + list(b.items()):
+                    w = min(wa + wb, k + 1)
+                    if w == 0:
+                        continue
+                    if w not in sums:
+                        sums[w] = Bool(f"gt_{name}_{counter}_{w}")
+                    constraints.append(Or([Not(x) for x in [xa, xb] if x is not None] + [sums[w]]))
+            counter += 1
+            merged.append(sums)
+        if len(nodes) % 2 == 1:
+            merged.append(nodes[-1])
+        nodes = merged
+
+    if nodes and k + 1 in nodes[0]:
+        constraints.append(Not(nodes[0][k + 1]))
+    return constraints
+
+def Pb_bdd(bool_vars, coeffs, k, name):
+    bool_vars, coeffs, k = normal_form(bool_vars, coeffs, k)
+    n = len(bool_vars)
+
+    # reachable[i]: bitset of the sums (up to k) of the subsets of the literals from i onwards
+    reachable = [1] * (n + 1)
+    for i in range(n - 1, -1, -1):
+        reachable[i] = (reachable[i + 1] | (reachable[i + 1] << coeffs[i])) & ((1 << (k + 1)) - 1)
+    rest = [sum(coeffs[i:]) for i in range(n + 1)]
+
+    # Node (i, r): the literals from i onwards weigh at most r. Budgets between two
+    # reachable sums are equivalent, so r is rounded down to the closest one.
+    def node(i, r):
+        if r < 0:
+            return False
+        if rest[i] <= r:
+            return True
+        return (i, (reachable[i] & ((1 << (r + 1)) - 1)).bit_length() - 1)
+
+    root = node(0, k)
+    if root is True:
+        return []
+
+    constraints = []
+    literals = {root: Bool(f"bdd_{name}_{root[0]}_{root[1]}")}
+    frontier = [root]
+    while frontier:
+        i, r = frontier.pop()
+        v = literals[(i, r)]
+        for child, premise in [(node(i + 1, r), [Not(v)]), (node(i + 1, r - coeffs[i]), [Not(v), Not(bool_vars[i])])]:
+            if child is True:
+                continue
+            if child is False:
+                constraints.append(Or(premise))
+                continue
+            if child not in literals:
+                literals[child] = Bool(f"bdd_{name}_{child[0]}_{child[1]}")
+                frontier.append(child)
+            constraints.append(Or(premise + [literals[child]]))
+
+    constraints.append(literals[root])
+    return constraints
+
+def Pb_sorting_network(bool_vars, coeffs, k, name):
+    bool_vars, coeffs, k = normal_form(bool_vars, coeffs, k)
+
+    # Every literal is repeated as many times as its coefficient, then sorted in
+    # descending order: the (k + 1)-th output must be false
+    inputs = [xi for xi, wi in zip(bool_vars, coeffs) for _ in range(wi)]
+    if len(inputs) <= k:
+        return []
+    size = 1 << (len(inputs) - 1).bit_length()
+    wires = inputs + [BoolVal(False)] * (size - len(inputs))
+
+    constraints = []
+    counter = 0
+    def comparator(i, j):
+        nonlocal counter
+        a, b = wires[i], wires[j]
+        if is_false(b):
+            return
+        if is_false(a):
+            wires[i], wires[j] = b, a
+            return
+        high, low = Bool(f"sn_{name}_{counter}_h"), Bool(f"sn_{name}_{counter}_l")
+        counter += 1
+        constraints.append(Or(Not(a), high))
+        constraints.append(Or(Not(b), high))
+        constraints.append(Or(Not(a), Not(b), low))
+        wires[i], wires[j] = high, low
+
+    # Batcher's odd-even merge sort
+    p = 1
+    while p < size:
+        step = p
+        while step >= 1:
+            for j in range(step % p, size - step, 2 * step):
+                for i in range(min(step, size - j - step)):
+                    if (i + j) // (2 * p) == (i + j + step) // (2 * p):
+                        comparator(i + j, i + j + step)
+            step //= 2
+        p *= 2
+
+    constraints.append(Not(wires[k]))
+    return constraints
+
+PB_ENCODERS = {
+    'seq_counter': Pb_seq_counter,
+    'adder': lambda bool_vars, coeffs, k, name: Pb_adder_networks(bool_vars, coeffs, k),
+    'generalized_totalizer': Pb_generalized_totalizer,
+    'bdd': Pb_bdd,
+    'sorting_network': Pb_sorting_network
+}
+
+def select_pb_encoder(bool_vars, coeffs, k):
+    # Picks the encoding expected to be the smallest from the profile of the
+    # normalised coefficients, the literals themselves are never looked at
+    _, coeffs, k = normal_form(bool_vars, coeffs, k, negate = lambda lit: lit)
+    n = len(coeffs)
+    distinct = len(set(coeffs))
+    if distinct == 1:
+        # Cardinality constraint: the network grows with n log^2 n, the totalizer with n k
+        return 'generalized_totalizer' if k < max(1, ld_int(n)) ** 2 else 'sorting_network'
+    if distinct <= 3:
+        # Few weights reach few distinct partial sums
+        return 'generalized_totalizer'
+    if n * k <= 100000:
+        return 'bdd'
+    return 'adder'
+
+def Pb_encode(bool_vars, coeffs, k, name, encoder = None):
+    if sum(coeffs) <= k:
+        return []
+    if encoder is None:
+        encoder = select_pb_encoder(bool_vars, coeffs, k)
+    return PB_ENCODERS[encoder](bool_vars, coeffs, k, name)
+
+# Encodings over the integer literals of a ClauseStore: the same encoders add
+# their clauses to the store, which hold only when the guard literal is true
+def normal_form_cnf(store, lits, coeffs, rhs, guard = None):
+    lits, coeffs, rhs = normal_form(lits, coeffs, rhs, negate = lambda lit: -lit)
+    # Literals heavier than the RHS are false
+    simplified_lits, simplified_coeffs = [], []
+    for lit, coeff in zip(lits, coeffs):
+        if coeff <= rhs:
+            simplified_lits.append(lit)
+            simplified_coeffs.append(coeff)
+        else:
+            store.add([-lit], guard)
+    return simplified_lits, simplified_coeffs, rhs
+
+def Pb_seq_counter_cnf(store, lits, coeffs, k, guard = None):
+    lits, coeffs, k = normal_form_cnf(store, lits, coeffs, k, guard)
+    n = len(lits)
+    if n == 0:
+        return
+
+    s = [[store.new_var() for j in range(k + 1)] for i in range(n + 1)]
+    for i in range(1, n + 1):
+        wi = coeffs[i - 1]
+        for j in range(1, k + 1):
+            if i >= 2 and j <= k:
+                store.add([-s[i - 1][j], s[i][j]], guard)
+            if j <= wi:
+                store.add([-lits[i - 1], s[i][j]], guard)
+            if i >= 2 and j <= k - wi:
+                store.add([-s[i - 1][j], -lits[i - 1], s[i][j + wi]], guard)
+        if i >= 2:
+            store.add([-s[i - 1][k + 1 - wi], -lits[i - 1]], guard)
+
+def Pb_adder_networks_cnf(store, lits, coeffs, k, guard = None):
+    lits, coeffs, k = normal_form_cnf(store, lits, coeffs, k, guard)
+    if len(lits) == 0 or k == 0:
+        return
+
+    # The sum and carry outputs are defined whatever the guard, only the final
+    # comparison with k is guarded
+    def full_adder(a, b, c):
+        carry, sum = store.new_var(), store.new_var()
+        store.add([b, c, -carry])
+        store.add([a, c, -carry])
+        store.add([a, b, -carry])
+        store.add([-b, -c, carry])
+        store.add([-a, -c, carry])
+        store.add([-a, -b, carry])
+        store.add([a, b, c, -sum])
+        store.add([a, -b, -c, -sum])
+        store.add([-a, b, -c, -sum])
+        store.add([-a, -b, c, -sum])
+        store.add([-a, -b, -c, sum])
+        store.add([-a, b, c, sum])
+        store.add([a, -b, c, sum])
+        store.add([a, b, -c, sum])
+        for x in [a, b, c]:
+            store.add([-carry, -sum, x])
+            store.add([carry, sum, -x])
+        return sum, carry
+
+    def half_adder(a, b):
+        carry, sum = store.new_var(), store.new_var()
+        store.add([a, -carry])
+        store.add([b, -carry])
+        store.add([-a, -b, carry])
+        store.add([-a, -b, -sum])
+        store.add([a, b, -sum])
+        store.add([-a, b, sum])
+        store.add([a, -b, sum])
+        return sum, carry
+
+    buckets = [[lit for lit, coeff in zip(lits, coeffs) if (1 << bit) & coeff] for bit in range(ld_int(k))]
+    result = [None] * len(buckets)
+    i = 0
+    while i < len(buckets):
+        if len(buckets[i]) == 0:
+            i += 1
+            continue
+        if i == len(buckets) - 1 and len(buckets[i]) >= 2:
+            buckets.append([])
+            result.append(None)
+        while len(buckets[i]) >= 3:
+            sum, carry = full_adder(buckets[i].pop(0), buckets[i].pop(0), buckets[i].pop(0))
+            buckets[i].append(sum)
+            buckets[i + 1].append(carry)
+        if len(buckets[i]) == 2:
+            sum, carry = half_adder(buckets[i].pop(0), buckets[i].pop(0))
+            buckets[i].append(sum)
+            buckets[i + 1].append(carry)
+        result[i] = buckets[i].pop(0)
+        i += 1
+
+    # result <= k, most significant bits last
+    kBits = num_to_bits(len(result), k)
+    for i in range(len(result)):
+        if kBits[i] or result[i] is None:
+            continue
+        clause = [-result[i]]
+        for j in range(i + 1, len(result)):
+            if result[j] is None:
+                continue
+            clause.append(-result[j] if kBits[j] else result[j])
+        if any(kBits[j] and result[j] is None for j in range(i + 1, len(result))):
+            continue
+        store.add(clause, guard)
+
+def Pb_generalized_totalizer_cnf(store, lits, coeffs, k, guard = None):
+    lits, coeffs, k = normal_form_cnf(store, lits, coeffs, k, guard)
+
+    nodes = [{wi: xi} for xi, wi in zip(lits, coeffs)]
+    while len(nodes) > 1:
+        merged = []
+        for a, b in zip(nodes[0::2], nodes[1::2]):
+            sums = {}
+            for wa, xa in [(0, None)] + list(a.items()):
+                for wb, xb in [(0, None)] + list(b.items()):
+                    w = min(wa + wb, k + 1)
+                    if w == 0:
+                        continue
+                    if w not in sums:
+                        sums[w] = store.new_var()
+                    store.add([-x for x in [xa, xb] if x is not None] + [sums[w]])
+            merged.append(sums)
+        if len(nodes) % 2 == 1:
+            merged.append(nodes[-1])
+        nodes = merged
+
+    if nodes and k + 1 in nodes[0]:
+        store.add([-nodes[0][k + 1]], guard)
+
+def Pb_bdd_cnf(store, lits, coeffs, k, guard = None):
+    lits, coeffs, k = normal_form_cnf(store, lits, coeffs, k, guard)
+    n = len(lits)
+
+    reachable = [1] * (n + 1)
+    for i in range(n - 1, -1, -1):
+        reachable[i] = (reachable[i + 1] | (reachable[i + 1] << coeffs[i])) & ((1 << (k + 1)) - 1)
+    rest = [sum(coeffs[i:]) for i in range(n + 1)]
+
+    def node(i, r):
+        if r < 0:
+            return False
+        if rest[i] <= r:
+            return True
+        return (i, (reachable[i] & ((1 << (r + 1)) - 1)).bit_length() - 1)
+
+    root = node(0, k)
+    if root is True:
+        return
+
+    literals = {root: store.new_var()}
+    frontier = [root]
+    while frontier:
+        i, r = frontier.pop()
+        v = literals[(i, r)]
+        for child, premise in [(node(i + 1, r), [-v]), (node(i + 1, r - coeffs[i]), [-v, -lits[i]])]:
+            if child is True:
+                continue
+            if child is False:
+                store.add(premise)
+                continue
+            if child not in literals:
+                literals[child] = store.new_var()
+                frontier.append(child)
+            store.add(premise + [literals[child]])
+
+    store.add([literals[root]], guard)
+
+def Pb_sorting_network_cnf(store, lits, coeffs, k, guard = None):
+    lits, coeffs, k = normal_form_cnf(store, lits, coeffs, k, guard)
+
+    # None wires are constantly false
+    inputs = [xi for xi, wi in zip(lits, coeffs) for _ in range(wi)]
+    if len(inputs) <= k:
+        return
+    size = 1 << (len(inputs) - 1).bit_length()
+    wires = inputs + [None] * (size - len(inputs))
+
+    def comparator(i, j):
+        a, b = wires[i], wires[j]
+        if b is None:
+            return
+        if a is None:
+            wires[i], wires[j] = b, a
+            return
+        high, low = store.new_var(), store.new_var()
+        store.add([-a, high])
+        store.add([-b, high])
+        store.add([-a, -b, low])
+        wires[i], wires[j] = high, low
+
+    p = 1
+    while p < size:
+        step = p
+        while step >= 1:
+            for j in range(step % p, size - step, 2 * step):
+                for i in range(min(step, size - j - step)):
+                    if (i + j) // (2 * p) == (i + j + step) // (2 * p):
+                        comparator(i + j, i + j + step)
+            step //= 2
+        p *= 2
+
+    store.add([-wires[k]], guard)
+
+PB_ENCODERS_CNF = {
+    'seq_counter': Pb_seq_counter_cnf,
+    'adder': Pb_adder_networks_cnf,
+    'generalized_totalizer': Pb_generalized_totalizer_cnf,
+    'bdd': Pb_bdd_cnf,
+    'sorting_network': Pb_sorting_network_cnf
+}
+
+def Pb_encode_cnf(store, lits, coeffs, k, encoder = None, guard = None):
+    if sum(coeffs) <= k:
+        return
+    if encoder is None:
+        encoder = select_pb_encoder(lits, coeffs, k)
+    PB_ENCODERS_CNF[encoder](store, lits, coeffs, k, guard)
@@ -0,0 +1,140 @@
+from z3 import sat, unsat, unknown
+from threading import Timer
+from .pseudoboolean_constraints import Pb_encode_cnf
+from .search import DistanceBounds, minimize
+from Models.LNS.lns import heuristic_upper_bound
+from preprocessing import prune_arcs, arc_lists
+import math
+import time
+
+# mcp solver names -> PySAT solver names
+PYSAT_SOLVERS = {'glucose': 'glucose4', 'minisat': 'minisat22'}
+
+
+class PySatSolver:
+    # Incremental PySAT solver fed from a ClauseStore, with the subset of the Z3
+    # Solver interface used by search.minimize. Clauses added to the store after
+    # a check are passed to the solver before the next one.
+    def __init__(self, store, name):
+        from pysat.solvers import Solver
+        self.store = store
+        self.solver = Solver(name=name)
+        self.flushed = 0
+        self.timeout = None
+
+    def flush(self):
+        clause = []
+        clauses = self.store.clauses
+        for i in range(self.flushed, len(clauses)):
+            if clauses[i] == 0:
+                self.solver.add_clause(clause)
+                clause = []
+            else:
+                clause.append(clauses[i])
+        self.flushed = len(clauses)
+
+    def set(self, key, value):
+        if key == 'timeout':
+            self.timeout = value
+
+    def add(self, lit):
+        self.store.add([lit])
+
+    def check(self, *assumptions):
+        self.flush()
+        if self.timeout is None:
+            return sat if self.solver.solve(assumptions=list(assumptions)) else unsat
+
+        timer = Timer(self.timeout / 1000, self.solver.interrupt)
+        timer.start()
+        result = self.solver.solve_limited(assumptions=list(assumptions), expect_interrupt=True)
+        timer.cancel()
+        self.solver.clear_interrupt()
+        return unknown if result is None else (sat if result else unsat)
+
+    def model(self):
+        return self.solver.get_model()
+
+    def delete(self):
+        self.solver.delete()
+
+
+class ClauseDistanceBounds(DistanceBounds):
+    # search.DistanceBounds on the integer literals of a ClauseStore
+    def __init__(self, store, terms, distances=None):
+        super().__init__(store, terms, distances)
+        self.store = store
+
+    def new_literal(self, name):
+        return self.store.new_var(name)
+
+    def negate(self, lit):
+        return -lit
+
+    def add_implication(self, premise, conclusion):
+        self.store.add([conclusion], premise)
+
+    def add_pb(self, active, terms, bound):
+        Pb_encode_cnf(self.store, [lit for lit, _ in terms], [d for _, d in terms], bound, guard = active)
+
+
+def pysat_model(m, n, s, l, D, solver_name, symmetry_breaking = False, implied_constraint = False, search = 'binary', timeout_duration = None, incumbent = None, lower_bound = 0, heuristic_duration = 1, position_encoding = 'onehot', distance_encoding = None):
+    # Same search as sat_model, on the integer clauses of build_sat_cnf solved by a
+    # PySAT solver ('glucose' or 'minisat')
+    from .sat_model import build_sat_cnf, courier_distances_cnf, default_distance_encoding
+    from .utils import routes_objective, extract_routes
+    if search not in ['linear', 'binary']:
+        raise ValueError(f"Input parameter [search] must be 'linear' or 'binary', was given '{search}'")
+
+    start_time = time.time()
+
+    # A routing found by a short heuristic run is the initial incumbent and upper bound
+    best_max_distance, best_routes = heuristic_upper_bound(m, n, s, l, D, heuristic_duration, lower_bound)
+    if incumbent is not None and best_routes is not None:
+        incumbent.publish(best_max_distance, best_routes, 'heuristic')
+    heuristic_time = time.time() - start_time
+
+    arcs = prune_arcs(m, n, l, s, D, best_max_distance)
+    out_arcs, _ = arc_lists(arcs)
+    store, x, y = build_sat_cnf(m, n, s, l, D, symmetry_breaking, implied_constraint, arcs, position_encoding)
+    solver = PySatSolver(store, PYSAT_SOLVERS[solver_name])
+
+    low = lower_bound
+    high = sum(max(row) for row in D) if best_routes is None else best_max_distance - 1  # Initial upper bound
+
+    # Define the distance traveled by any courier
+    distance_start = time.time()
+    terms = [[(arc, D[j][k]) for (j, k), arc in y[i].items() if D[j][k] > 0] for i in range(m)]
+    if distance_encoding is None:
+        distance_encoding = default_distance_encoding(terms, high, 'pysat')
+    if distance_encoding == 'order':
+        bounds = ClauseDistanceBounds(store, terms, courier_distances_cnf(store, m, n, D, y, high + 1))
+    elif distance_encoding == 'pb':
+        bounds = ClauseDistanceBounds(store, terms)
+    else:
+        raise ValueError(f"Unknown distance encoding: {distance_encoding}")
+
+    def decode(model):
+        routes = extract_routes(lambda arc: model[arc - 1] > 0, m, n, y, out_arcs)
+        return routes_objective(routes, D), routes
+
+    # The heuristic and the distance encoding are charged to the timeout
+    encoding_time = time.time()
+    charged_time = heuristic_time + encoding_time - distance_start
+    timeout = encoding_time + timeout_duration - charged_time
+
+    obj, routes, finished = minimize(solver, bounds, decode, low, high, search, timeout, incumbent, solver_name)
+    solver.delete()
+    if routes is not None:
+        best_max_distance, best_routes = obj, routes
+
+    end_time = time.time()
+    if not finished or end_time >= timeout:
+        solving_time = timeout_duration
+    else:
+        solving_time = math.floor(end_time - encoding_time + charged_time)
+
+    if best_routes is None:
+        return ("N/A" if solving_time == timeout_duration else "UNSAT", solving_time, None)
+    else:
+        return (best_max_distance, solving_time, best_routes)
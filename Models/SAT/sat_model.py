@@ -3,185 +3,365 @@ from .utils import *
 from .cardinality_constraints import *
 from .pseudoboolean_constraints import * 
 from .logical_relation_constraints import *
+from .search import SEARCHES, DistanceBounds, minimize, optimize, max_distance_levels
+from .clause_store import ClauseStore
+from Models.LNS.lns import heuristic_upper_bound
+from preprocessing import prune_arcs, arc_lists, capacity_classes
+from formula_cache import formula_key, cached_formula
 import time
 
-def sat_model(m, n, s, l, D, symmetry_breaking = False, implied_constraint = False, search='binary', timeout_duration = None):
+def sat_variables(m, n, arcs):
+    out_arcs, _ = arc_lists(arcs)
+    x = [[Bool(f"x_{i}_{j}") for j in range(n)] for i in range(m)]  # x[i, j]: courier i delivers item j
+    y = [{(j, k): Bool(f"y_{i}_{j}_{k}") for j in range(n + 1) for k in out_arcs[j]} for i in range(m)]  # y[i][j, k]: courier i travels from j to k
+    return x, y
+
+def build_sat_model(m, n, s, l, D, symmetry_breaking = False, implied_constraint = False, arcs = None, position_encoding = 'onehot', pb_encoding = None, amo_encoding = None):
     # n: number of items
     # m: number of couriers
     # l: load capacities of couriers
     # s: sizes of items
     # D: distance matrix between points (including the origin)
+    # arcs: arcs[j][k] is False when j -> k was pruned by the preprocessing
+    # position_encoding: 'onehot' or 'binary' positions of the items in their route
+    # pb_encoding: encoding of the capacity constraints, chosen per courier when None
+    # amo_encoding: encoding of the exactly-one constraints, chosen per group size when None
 
-    start_time = time.time()
+    if arcs is None:
+        arcs = prune_arcs(m, n, l, s, D)
+    out_arcs, in_arcs = arc_lists(arcs)
 
-    x = [[Bool(f"x_{i}_{j}") for j in range(n)] for i in range(m)]  # x[i, j]: courier i delivers item j
-    y = [[[Bool(f"y_{i}_{j}_{k}") for k in range(n + 1)] for j in range(n + 1)] for i in range(m)]  # y[i, j, k]: courier i travels from j to k
-    seq = [[Bool(f"seq_{i}_{j}") for j in range(n)] for i in range(n)]  # seq[i][j]: item i is in position j in the sequence
+    x, y = sat_variables(m, n, arcs)
     
     solver = Solver()
 
-    # Convert sizes and load capacities to binary representations
-    s_bin = [num_to_bits(ld_int(sj), sj)[::-1] for sj in s]
-    l_bin = [num_to_bits(ld_int(li), li)[::-1] for li in l]
-    
     # Constraints
     
     # 1. Each item must be assigned to exactly one courier
     for j in range(n):
-        solver.add(exactly_one([x[i][j] for i in range(m)], f"assign_item_{j}"))
+        solver.add(exactly_one([x[i][j] for i in range(m)], f"assign_item_{j}", amo_encoding))
 
     # 2. Load capacity constraints for each courier
     for i in range(m):
-        # solver.add(Pb_adder_networks([x[i][j] for j in range(n)], s, l[i]))
-        solver.add(Pb_seq_counter([x[i][j] for j in range(n)], s, l[i], f"load_courier_{i}"))
+        solver.add(Pb_encode([x[i][j] for j in range(n)], s, l[i], f"load_courier_{i}", pb_encoding))
 
     # 3. Route constraints: each courier's route must start and end at the origin
     for i in range(m):
         # Start at the origin
-        solver.add(exactly_one([y[i][n][k] for k in range(n)], f"start_{i}"))
+        solver.add(exactly_one([y[i][n, k] for k in out_arcs[n]], f"start_{i}", amo_encoding))
         # End at the origin
-        solver.add(exactly_one([y[i][k][n] for k in range(n)], f"end_{i}"))
+        solver.add(exactly_one([y[i][k, n] for k in in_arcs[n]], f"end_{i}", amo_encoding))
 
         for j in range(n):
             # If a courier visits an item, it must leave that item
-            solver.add(Implies(x[i][j], exactly_one([y[i][j][k] for k in range(n + 1)], f"visit_{i}_{j}")))
+            solver.add(Implies(x[i][j], exactly_one([y[i][j, k] for k in out_arcs[j]], f"visit_{i}_{j}", amo_encoding)))
             # If a courier arrives at an item, it must leave from that item
-            solver.add(Implies(x[i][j], exactly_one([y[i][k][j] for k in range(n + 1)], f"arrive_{i}_{j}")))
+            solver.add(Implies(x[i][j], exactly_one([y[i][k, j] for k in in_arcs[j]], f"arrive_{i}_{j}", amo_encoding)))
 
             # If y[i][j] is false, all y[i][j][k] must be false
-            solver.add(And([Or(x[i][j], Not(y[i][j][k])) for k in range(n + 1)]))
-            solver.add(And([Or(x[i][j], Not(y[i][k][j])) for k in range(n + 1)]))
+            solver.add(And([Or(x[i][j], Not(y[i][j, k])) for k in out_arcs[j]]))
+            solver.add(And([Or(x[i][j], Not(y[i][k, j])) for k in in_arcs[j]]))
 
-    # 4. Preventing sub-tours within each courier's route
-    for i in range(n):
-        solver.add(exactly_one(seq[i], f"position_{i}"))
+    # 4. Preventing sub-tours within each courier's route. Positions are shared by
+    # all couriers, so the successor relation between the positions of two items
+    # is encoded once, behind succ[j, k], and every courier only implies succ[j, k]
+    if position_encoding == 'onehot':
+        seq = [[Bool(f"seq_{i}_{j}") for j in range(n)] for i in range(n)]  # seq[i][j]: item i is in position j in the sequence
+        for i in range(n):
+            solver.add(exactly_one(seq[i], f"position_{i}", amo_encoding))
+        first = [seq[i][0] for i in range(n)]
+        follows = successor
+    elif position_encoding == 'binary':
+        bits = max(1, (n - 1).bit_length())
+        seq = [[Bool(f"seq_{i}_{b}") for b in range(bits)] for i in range(n)]  # seq[i]: position of item i, least significant bit first
+        first = [And([Not(b) for b in seq[i]]) for i in range(n)]
+        follows = binary_successor
+    else:
+        raise ValueError(f"Unknown position encoding: {position_encoding}")
+
+    succ = {(j, k): Bool(f"succ_{j}_{k}") for j in range(n) for k in out_arcs[j] if k < n}  # succ[j, k]: item k follows item j
+    for (j, k), lit in succ.items():
+        solver.add(Implies(lit, follows(seq[j], seq[k])))
 
     for i in range(m):
-        for j in range(n):
-            for k in range(n):
-                solver.add(Implies(y[i][j][k], successor(seq[j], seq[k])))
-            solver.add(Implies(y[i][n][j], seq[j][0]))
+        for (j, k), arc in y[i].items():
+            if j < n and k < n:
+                solver.add(Implies(arc, succ[j, k]))
+            elif j == n:
+                solver.add(Implies(arc, first[k]))
 
-    # Symmetry breaking constraints
+    # Symmetry breaking constraints: the couriers of a capacity class are
+    # interchangeable, their first items are ordered by value precedence
     if symmetry_breaking:
-        w = [[Bool(f"w_{i}_{k}") for k in range(ld_int(sum(s)))] for i in range(m)]
+        for couriers in capacity_classes(l):
+            if len(couriers) > 1:
+                solver.add(value_precedence([x[i] for i in couriers], f"precedence_{couriers[0]}"))
 
-        sorted_loads = [(l[i], i) for i in range(m)]
-        sorted_loads.sort(reverse = True)
-        l, permutation = zip(*sorted_loads)
-        l = list(l)
-        permutation = list(permutation)
-        
-        solver.add([lex_less_equal(w[i+1], w[i]) for i in range(len(w) - 1)])
+    # Additional implied constraints
+    if implied_constraint:
+        for i in range(m):
+            solver.add(at_least_one(x[i]))
 
-        # Break symmetry within same load amounts
-        for i in range(m - 1):
-            solver.add(Implies(same_load_constraint(w[i], w[i + 1]), lex_less_equal(x[i], x[i + 1])))
+        # Single-node loops are never created, the preprocessing drops every j -> j arc
 
-        for i in range(m):
-            pass
-            # solver.add(conditional_sum_K_bin(x[i], s_bin, w[i], f"courier_load_{i}"))
-            # solver.add(lex_less_equal(w[i], l_bin[i]))
+    return solver, x, y
+
+
+def build_sat_cnf(m, n, s, l, D, symmetry_breaking = False, implied_constraint = False, arcs = None, position_encoding = 'onehot', pb_encoding = None, amo_encoding = None):
+    # Same model as build_sat_model, emitted as integer clauses into a ClauseStore
+    # instead of Z3 expressions. x and y hold the variables of the store, named
+    # as the Bool constants of build_sat_model.
+    if arcs is None:
+        arcs = prune_arcs(m, n, l, s, D)
+    out_arcs, in_arcs = arc_lists(arcs)
+
+    store = ClauseStore()
+    x = [[store.new_var(f"x_{i}_{j}") for j in range(n)] for i in range(m)]
+    y = [{(j, k): store.new_var(f"y_{i}_{j}_{k}") for j in range(n + 1) for k in out_arcs[j]} for i in range(m)]
+
+    # 1. Each item must be assigned to exactly one courier
+    for j in range(n):
+        exactly_one_cnf(store, [x[i][j] for i in range(m)], encoding = amo_encoding)
+
+    # 2. Load capacity constraints for each courier
+    for i in range(m):
+        Pb_encode_cnf(store, [x[i][j] for j in range(n)], s, l[i], pb_encoding)
+
+    # 3. Route constraints: each courier's route must start and end at the origin
+    for i in range(m):
+        exactly_one_cnf(store, [y[i][n, k] for k in out_arcs[n]], encoding = amo_encoding)
+        exactly_one_cnf(store, [y[i][k, n] for k in in_arcs[n]], encoding = amo_encoding)
+
+        for j in range(n):
+            exactly_one_cnf(store, [y[i][j, k] for k in out_arcs[j]], guard = x[i][j], encoding = amo_encoding)
+            exactly_one_cnf(store, [y[i][k, j] for k in in_arcs[j]], guard = x[i][j], encoding = amo_encoding)
+
+            for k in out_arcs[j]:
+                store.add([x[i][j], -y[i][j, k]])
+            for k in in_arcs[j]:
+                store.add([x[i][j], -y[i][k, j]])
+
+    # 4. Preventing sub-tours, with the successor relation shared by all couriers
+    if position_encoding == 'onehot':
+        seq = [[store.new_var(f"seq_{i}_{j}") for j in range(n)] for i in range(n)]
+        for i in range(n):
+            exactly_one_cnf(store, seq[i], encoding = amo_encoding)
+        first = [seq[i][0] for i in range(n)]
+        follows = successor_cnf
+    elif position_encoding == 'binary':
+        bits = max(1, (n - 1).bit_length())
+        seq = [[store.new_var(f"seq_{i}_{b}") for b in range(bits)] for i in range(n)]
+        # first[i]: item i is in position 0
+        first = []
+        for i in range(n):
+            lit = store.new_var()
+            for b in seq[i]:
+                store.add([-lit, -b])
+            store.add(seq[i] + [lit])
+            first.append(lit)
+        follows = binary_successor_cnf
+    else:
+        raise ValueError(f"Unknown position encoding: {position_encoding}")
+
+    succ = {(j, k): store.new_var(f"succ_{j}_{k}") for j in range(n) for k in out_arcs[j] if k < n}
+    for (j, k), lit in succ.items():
+        follows(store, seq[j], seq[k], guard = lit)
+
+    for i in range(m):
+        for (j, k), arc in y[i].items():
+            if j < n and k < n:
+                store.add([-arc, succ[j, k]])
+            elif j == n:
+                store.add([-arc, first[k]])
+
+    # Symmetry breaking constraints
+    if symmetry_breaking:
+        for couriers in capacity_classes(l):
+            if len(couriers) > 1:
+                value_precedence_cnf(store, [x[i] for i in couriers])
 
     # Additional implied constraints
     if implied_constraint:
         for i in range(m):
-            solver.add(at_least_one(x[i]))
+            at_least_one_cnf(store, x[i])
+
+    return store, x, y
+
+
+# Largest arcs * cap product per courier for which the order encoding of the
+# distances is built, per backend. Z3 gets the encoding as expressions built in
+# Python, which dominate the runtime above the limit, and solves the larger
+# formula more slowly than the PB bounds. The PySAT backends take integer
+# clauses and their CDCL solvers profit from the order encoding far beyond it.
+ORDER_ENCODING_LIMITS = {'z3': 5000, 'pysat': 100000}
+
+
+def default_distance_encoding(terms, high, backend='z3'):
+    # 'order' when the order encoding of the distances up to high + 1 is small
+    # enough for the backend, 'pb' otherwise
+    size = (high + 1) * max(len(t) for t in terms)
+    return 'order' if size <= ORDER_ENCODING_LIMITS[backend] else 'pb'
+
+
+def courier_distances(m, n, D, y, cap):
+    # Order encoding of the partial sums of the distance of every courier, points
+    # in index order. A visited point is left through exactly one arc, so each
+    # layer adds one of its outgoing distances. Sums are capped at cap, and
+    # distances[i] maps each reachable sum v > 0 to a literal implied by the
+    # distance of courier i being at least v.
+    distances, constraints = [], []
+    for i in range(m):
+        outgoing = [[] for _ in range(n + 1)]
+        for (j, k), arc in y[i].items():
+            if D[j][k] > 0:
+                outgoing[j].append((arc, min(D[j][k], cap)))
+
+        sums = {0: None}
+        for j, arcs in enumerate(outgoing):
+            if not arcs:
+                continue
+            layer = {}
+            def at_least(v):
+                if v not in layer:
+                    layer[v] = Bool(f"dist_{i}_{j}_ge_{v}")
+                return layer[v]
+            for v, lit in sums.items():
+                premise = [] if lit is None else [Not(lit)]
+                if lit is not None:
+                    constraints.append(Or(premise + [at_least(v)]))
+                for arc, d in arcs:
+                    constraints.append(Or(premise + [Not(arc), at_least(min(v + d, cap))]))
+            # A sum at least v' > v is also at least v
+            reached = sorted(layer)
+            for low, high in zip(reached, reached[1:]):
+                constraints.append(Or(Not(layer[high]), layer[low]))
+            sums = {0: None, **layer}
+
+        del sums[0]
+        distances.append(sums)
+    return distances, constraints
+
+
+def courier_distances_cnf(store, m, n, D, y, cap):
+    # courier_distances over the integer literals of a ClauseStore
+    distances = []
+    for i in range(m):
+        outgoing = [[] for _ in range(n + 1)]
+        for (j, k), arc in y[i].items():
+            if D[j][k] > 0:
+                outgoing[j].append((arc, min(D[j][k], cap)))
+
+        sums = {0: None}
+        for j, arcs in enumerate(outgoing):
+            if not arcs:
+                continue
+            layer = {}
+            for v, lit in sums.items():
+                premise = [] if lit is None else [-lit]
+                for target, clause in [(v, premise)] + [(min(v + d, cap), premise + [-arc]) for arc, d in arcs]:
+                    if target == v and lit is None:
+                        continue
+                    if target not in layer:
+                        layer[target] = store.new_var()
+                    store.add(clause + [layer[target]])
+            reached = sorted(layer)
+            for low, high in zip(reached, reached[1:]):
+                store.add([-layer[high], layer[low]])
+            sums = {0: None, **layer}
+
+        del sums[0]
+        distances.append(sums)
+    return distances
+
+
+def sat_model(m, n, s, l, D, symmetry_breaking = False, implied_constraint = False, search='binary', timeout_duration = None, incumbent = None, lower_bound = 0, heuristic_duration = 1, position_encoding = 'onehot', distance_encoding = None, use_cache = False, builder = 'clauses', maxsat_engine = None):
+    # distance_encoding: 'order' encodes the courier distances once, 'pb' adds a
+    # PB constraint per probed bound, chosen from the size of the instance when None
+    # use_cache: reload the clauses of an instance already encoded with the same options
+    # (clauses builder only)
+    # builder: 'clauses' emits integer clauses loaded into Z3 in bulk, 'z3' builds Z3 expressions
+    # search: 'linear' or 'binary' probe bounds with check(), 'optimize' minimizes the
+    # maximum distance with z3.Optimize, 'maxsat' minimizes the weights of its order
+    # encoded levels with the MaxSAT engine maxsat_engine
+    if search not in SEARCHES:
+        raise ValueError(f"Input parameter [search] must be one of {SEARCHES}, was given '{search}'")
+
+    start_time = time.time()
+
+    # A routing found by a short heuristic run is the initial incumbent and upper bound
+    best_max_distance, best_routes = heuristic_upper_bound(m, n, s, l, D, heuristic_duration, lower_bound)
+    if incumbent is not None and best_routes is not None:
+        incumbent.publish(best_max_distance, best_routes, 'heuristic')
+    heuristic_time = time.time() - start_time
+
+    # Arcs that cannot appear in a routing better than the heuristic one are never encoded
+    arcs = prune_arcs(m, n, l, s, D, best_max_distance)
+    def build():
+        return build_sat_cnf(m, n, s, l, D, symmetry_breaking, implied_constraint, arcs, position_encoding)[0]
+    if builder == 'clauses' and use_cache:
+        key = formula_key('sat', m, n, l, s, D, arcs, symmetry_breaking=symmetry_breaking, implied_constraint=implied_constraint,
+                          position_encoding=position_encoding, pb_encoding=None, amo_encoding=None)
+        solver = cached_formula(key, build).to_z3()
+    elif builder == 'clauses':
+        solver = build().to_z3()
+    elif builder == 'z3':
+        solver = build_sat_model(m, n, s, l, D, symmetry_breaking, implied_constraint, arcs, position_encoding)[0]
+    else:
+        raise ValueError(f"Unknown builder: {builder}")
+    x, y = sat_variables(m, n, arcs)
+    out_arcs, _ = arc_lists(arcs)
+
+    low = lower_bound
+    high = sum(max(row) for row in D) if best_routes is None else best_max_distance - 1  # Initial upper bound
 
-        # Ensure no single-node loops
-        for i in range(m):
-            for j in range(n):
-                solver.add(Not(y[i][j][j]))
-        
     # Define the distance traveled by any courier
-    flatten_y = [[y[i][j][k] for j in range(n + 1) for k in range(n + 1)] for i in range(m)]
-    flatten_D = [D[i][j] for i in range(n + 1) for j in range(n + 1)]
-    
+    distance_start = time.time()
+    terms = [[(arc, D[j][k]) for (j, k), arc in y[i].items() if D[j][k] > 0] for i in range(m)]
+    if distance_encoding is None:
+        distance_encoding = 'order' if search == 'maxsat' else default_distance_encoding(terms, high)
+    if distance_encoding == 'order':
+        # Encoded once, shared by every probe
+        distances, constraints = courier_distances(m, n, D, y, high + 1)
+        solver.add(constraints)
+    elif distance_encoding == 'pb':
+        if search == 'maxsat':
+            raise ValueError("The 'maxsat' search needs the order encoding of the distances")
+        distances = None
+    else:
+        raise ValueError(f"Unknown distance encoding: {distance_encoding}")
+
+    def decode(model):
+        routes = extract_routes(lambda arc: is_true(model.evaluate(arc)), m, n, y, out_arcs)
+        return routes_objective(routes, D), routes
+
+    # The heuristic and the distance encoding are charged to the timeout
     encoding_time = time.time()
-    timeout = encoding_time + timeout_duration
-
-    if search == 'linear':
-        solver.set('timeout', millisecs_left(time.time(), timeout))
-        while solver.check() == sat:
-            best_solution = solver.model()
-            best_max_distance = obj_function(best_solution, m, D, y)
-
-            if best_max_distance <= lower_bound:
-                break
-
-            upper_bound = best_max_distance - 1
-            solver.pop()
-            solver.push()
-
-            for i in range(m):
-                solver.add(PbLe([(lit, flatten_D[idx]) for idx, lit in enumerate(flatten_y[i])], mid))
-            
-            now = time.time()
-            if now >= timeout:
-                break
-            solver.set('timeout', millisecs_left(now, timeout))
-    elif search == 'binary':
-        # Binary search for minimizing the maximum distance
-        low = 0
-        high = sum(max(row) for row in D)  # Initial upper bound
-
-        best_solution = None
-        best_max_distance = None
-
-        while low <= high:
-            mid = (low + high) // 2
-            solver.push()
-
-            # Add the current distance constraint
-            for i in range(m):
-                solver.add(PbLe([(lit, flatten_D[idx]) for idx, lit in enumerate(flatten_y[i])], mid))
-                # solver.add(Pb_adder_networks(flatten_y[i], flatten_D, mid))
-
-            now = time.time()
-            if now >= timeout:
-                break
-            solver.set('timeout', millisecs_left(now, timeout)) 
-
-            if solver.check() == sat:
-                best_solution = solver.model()
-                best_max_distance = obj_function(best_solution, m, D, y)
-                high = mid - 1
-            else:
-                low = mid + 1
-            solver.pop()
+    charged_time = heuristic_time + encoding_time - distance_start
+    timeout = encoding_time + timeout_duration - charged_time
+
+    if search == 'optimize':
+        max_distance = Int('max_distance')
+        for i in range(m):
+            solver.add(Sum([If(arc, d, 0) for arc, d in terms[i]]) <= max_distance)
+        solver.add(max_distance >= low, max_distance <= high)
+        obj, routes, finished = optimize(solver, max_distance, decode, timeout, incumbent, 'sat', maxsat_engine)
+    elif search == 'maxsat':
+        constraints, soft = max_distance_levels(distances, low, high)
+        solver.add(constraints)
+        obj, routes, finished = optimize(solver, soft, decode, timeout, incumbent, 'sat', maxsat_engine)
     else:
-        raise ValueError(f"Input parameter [search] mush be either 'Linear' or 'Binary', was given '{search}'")
+        bounds = DistanceBounds(solver, terms, distances)
+        obj, routes, finished = minimize(solver, bounds, decode, low, high, search, timeout, incumbent)
+    if routes is not None:
+        best_max_distance, best_routes = obj, routes
 
     end_time = time.time()
-    if end_time >= timeout:
+    if not finished or end_time >= timeout:
         solving_time = timeout_duration
     else:
-        solving_time = math.floor(end_time - encoding_time)
+        solving_time = math.floor(end_time - encoding_time + charged_time)
     
-    if best_solution is None:
+    if best_routes is None:
         return ("N/A" if solving_time == timeout_duration else "UNSAT", solving_time, None)
     else:
-        routes = []
-        for i in range(m):
-            arcs = []
-            for j in range(n + 1):
-                for k in range(n + 1):
-                    if is_true(best_solution.evaluate(y[i][j][k])):
-                        arcs.append((j + 1, k + 1))
-
-            route = []
-            current_node = n + 1
-            while arcs:
-                for arc in arcs:
-                    if arc[0] == current_node:
-                        route.append(arc[1])
-                        current_node = arc[1]
-                        arcs.remove(arc)
-                        break
-
-            if route and route[-1] == n + 1:
-                route.pop(-1)
-
-            routes.append(route)
-    
-        return (best_max_distance, solving_time, routes)
+        return (best_max_distance, solving_time, best_routes)
@@ -0,0 +1,166 @@
+from z3 import *
+from .utils import millisecs_left
+import time
+
+# Values of the search parameter of the SAT and SMT models
+SEARCHES = ['linear', 'binary', 'optimize', 'maxsat']
+
+
+class DistanceBounds:
+    # Upper bounds on the distance of every courier. Each bound is encoded once,
+    # guarded by an activation literal, and enabled only through the assumptions
+    # of a check, so the clauses learned by the solver survive across probes.
+    # With order encoded distances a bound only forbids the smallest reachable
+    # sum above it, otherwise it is a PB constraint over the arcs. The literals
+    # are Z3 Booleans; subclasses emit other literals by overriding the last
+    # four methods.
+    def __init__(self, solver, terms, distances=None):
+        self.solver = solver
+        self.terms = terms  # terms[i]: (literal, distance) pairs of courier i
+        self.distances = distances  # distances[i]: reachable sum v -> literal "distance of courier i >= v"
+        self.literals = {}
+
+    def literal(self, bound):
+        if bound not in self.literals:
+            active = self.new_literal(f"max_distance_le_{bound}")
+            if self.distances is None:
+                for terms in self.terms:
+                    self.add_pb(active, terms, bound)
+            else:
+                for distance in self.distances:
+                    above = [v for v in distance if v > bound]
+                    if above:
+                        self.add_implication(active, self.negate(distance[min(above)]))
+            # A tighter bound implies every looser one
+            for other, other_active in self.literals.items():
+                if other < bound:
+                    self.add_implication(other_active, active)
+                else:
+                    self.add_implication(active, other_active)
+            self.literals[bound] = active
+        return self.literals[bound]
+
+    def new_literal(self, name):
+        return Bool(name)
+
+    def negate(self, lit):
+        return Not(lit)
+
+    def add_implication(self, premise, conclusion):
+        self.solver.add(Implies(premise, conclusion))
+
+    def add_pb(self, active, terms, bound):
+        self.solver.add(Implies(active, PbLe(terms, bound)))
+
+
+class TermBounds:
+    # Upper bounds on an integer term, the max_distance of the SMT models, with
+    # the same activation literals as DistanceBounds
+    def __init__(self, solver, term):
+        self.solver = solver
+        self.term = term
+        self.literals = {}
+
+    def literal(self, bound):
+        if bound not in self.literals:
+            active = Bool(f"max_distance_le_{bound}")
+            self.solver.add(Implies(active, self.term <= bound))
+            self.literals[bound] = active
+        return self.literals[bound]
+
+
+def max_distance_levels(distances, low, high):
+    # MaxSAT objective over order encoded distances: level v is implied by any
+    # courier travelling at least v, and each violated soft constraint "not level v"
+    # costs the gap to the previous reachable sum, so the cost of a model is its
+    # maximum distance up to a constant. Levels above high are hard-forbidden.
+    values = sorted({v for distance in distances for v in distance})
+    levels = {v: Bool(f"max_distance_ge_{v}") for v in values}
+    constraints, soft = [], []
+    for distance in distances:
+        for v, lit in distance.items():
+            constraints.append(Implies(lit, levels[v]))
+    previous = 0
+    for v in values:
+        if previous > 0:
+            constraints.append(Implies(levels[v], levels[previous]))
+        if v > high:
+            constraints.append(Not(levels[v]))
+        elif v > low:
+            soft.append((Not(levels[v]), v - previous))
+        previous = v
+    return constraints, soft
+
+
+def minimize(solver, bounds, decode, low, high, search, timeout, incumbent=None, source='sat'):
+    # Linear search tightens the bound after every solution (SAT -> UNSAT), binary
+    # search bisects [low, high]. Returns (best objective, best routes, finished),
+    # finished is False when the time ran out before the search was over.
+    best_obj, best_routes = None, None
+    while low <= high:
+        # In a portfolio, the best objective found by any other method tightens the search
+        if incumbent is not None and incumbent.bound() is not None:
+            high = min(high, incumbent.bound() - 1)
+            if low > high:
+                break
+
+        bound = high if search == 'linear' else (low + high) // 2
+
+        now = time.time()
+        if now >= timeout:
+            return best_obj, best_routes, False
+        solver.set('timeout', millisecs_left(now, timeout))
+
+        active = bounds.literal(bound)
+        result = solver.check(active)
+        if result == sat:
+            best_obj, best_routes = decode(solver.model())
+            high = best_obj - 1
+            # Solutions above the probed bound are never needed again
+            solver.add(active)
+            if incumbent is not None:
+                incumbent.publish(best_obj, best_routes, source)
+        elif result == unsat:
+            low = bound + 1
+        else:
+            return best_obj, best_routes, False
+
+    return best_obj, best_routes, True
+
+
+def optimize(solver, objective, decode, timeout, incumbent=None, source='sat', maxsat_engine=None):
+    # Native optimization of the formula of solver with z3.Optimize. objective is
+    # either an Int term to minimize, or (literal, weight) soft constraints whose
+    # violated weights add up to the objective (MaxSAT, core-guided by default,
+    # maxsat_engine: 'maxres', 'pd-maxres', 'wmax', 'rc2'). Every improving model
+    # is decoded as soon as the optimizer finds it. Returns the same triple as minimize.
+    opt = Optimize()
+    opt.add(solver.assertions())
+    if maxsat_engine is not None:
+        opt.set('maxsat_engine', maxsat_engine)
+    if isinstance(objective, list):
+        for lit, weight in objective:
+            opt.add_soft(lit, weight)
+    else:
+        opt.minimize(objective)
+
+    start_time = time.time()
+    best = [None, None]
+    def on_model(model):
+        obj, routes = decode(model)
+        if best[0] is None or obj < best[0]:
+            best[0], best[1] = obj, routes
+            print(f"Improving solution: {obj} after {time.time() - start_time:.2f}s")
+            if incumbent is not None:
+                incumbent.publish(obj, routes, source)
+    opt.set_on_model(on_model)
+
+    now = time.time()
+    if now >= timeout:
+        return None, None, False
+    opt.set('timeout', millisecs_left(now, timeout))
+    result = opt.check()
+    if result == sat:
+        # The optimum itself is not always reported through the callback
+        on_model(opt.model())
+    return best[0], best[1], result != unknown
@@ -0,0 +1,87 @@
+import sys
+import time
+import argparse
+from util import read_instances
+from campaign import parse_instances
+from bounds import lower_bound
+from Models.SAT.sat_model import sat_model
+from Models.SMT.smt_model import smt_model
+
+# Time to the first solution, to the best solution and to the proof of optimality
+# of every search of the SAT and SMT models, run from the root of the repository:
+# python -m Models.SAT.search_stats --instances 1-10 --searches binary optimize maxsat --timeout 60 --heuristic 0.01 --skip-lower-bound
+# The first solution is the first one found by the solver, after the heuristic
+# start. The formula cache is off, so every run includes the encoding.
+
+
+class SolutionTrace:
+    # Stands in for the portfolio incumbent to record when every solution is published
+    def __init__(self):
+        self.start_time = time.time()
+        self.solutions = []
+
+    def bound(self):
+        return None
+
+    def publish(self, obj, sol, source):
+        if source != 'heuristic':
+            self.solutions.append((time.time() - self.start_time, obj))
+        return True
+
+
+def search_stats(file_name, method, search, timeout, maxsat_engine=None, heuristic_duration=1, use_lower_bound=True):
+    m, n, l, s, D = read_instances(file_name)
+    trace = SolutionTrace()
+    options = dict(implied_constraint=True, search=search, timeout_duration=timeout, incumbent=trace,
+                   lower_bound=lower_bound(m, n, l, s, D) if use_lower_bound else 0, maxsat_engine=maxsat_engine,
+                   heuristic_duration=heuristic_duration)
+    if method == 'sat':
+        obj, solving_time, _ = sat_model(m, n, s, l, D, **options)
+    elif method == 'smt':
+        obj, solving_time, _ = smt_model(m, n, s, l, D, **options)
+    else:
+        raise ValueError(f"Unknown method: {method}")
+
+    return {
+        "obj": obj,
+        "first": trace.solutions[0][0] if trace.solutions else None,
+        "best": trace.solutions[-1][0] if trace.solutions else None,
+        "optimal": solving_time if solving_time < timeout else None,
+        "solutions": len(trace.solutions)
+    }
+
+
+def main(args):
+    parser = argparse.ArgumentParser(description='Compare the bisection and the native optimization of the SAT and SMT models.')
+    parser.add_argument('--instances', type=parse_instances, default=parse_instances('1-10'),
+                        help="Instances to solve, e.g. '1-10,13' (default: 1-10)")
+    parser.add_argument('--methods', nargs='+', default=['sat', 'smt'],
+                        help='Methods to compare (default: sat smt)')
+    parser.add_argument('--searches', nargs='+', default=['binary', 'optimize', 'maxsat'],
+                        help='Searches to compare (default: binary optimize maxsat)')
+    parser.add_argument('--maxsat-engine', default=None,
+                        help="MaxSAT engine of z3.Optimize, e.g. 'maxres', 'wmax', 'rc2' (default: Z3's)")
+    parser.add_argument('--heuristic', type=float, default=1,
+                        help='Duration in seconds of the heuristic start, shorter leaves more to the solver (default: 1)')
+    parser.add_argument('--skip-lower-bound', action='store_true',
+                        help='Start the searches from 0, so that they have to prove the optimum themselves')
+    parser.add_argument('--timeout', type=int, default=60,
+                        help='Timeout in seconds of every run (default: 60)')
+    options = parser.parse_args(args)
+
+    def seconds(value):
+        return '-' if value is None else f"{value:.2f}"
+
+    print(f"{'instance':>8} {'method':>6} {'search':>8} {'obj':>6} {'solutions':>9} {'first':>8} {'best':>8} {'optimal':>8}")
+    for instance in options.instances:
+        file_name = f'./Instances/inst{instance:02d}.dat'
+        for method in options.methods:
+            for search in options.searches:
+                stats = search_stats(file_name, method, search, options.timeout, options.maxsat_engine, options.heuristic,
+                                     not options.skip_lower_bound)
+                print(f"{instance:>8} {method:>6} {search:>8} {stats['obj']:>6} {stats['solutions']:>9} "
+                      f"{seconds(stats['first']):>8} {seconds(stats['best']):>8} {seconds(stats['optimal']):>8}", flush=True)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -37,17 +37,32 @@ def display_routing(routes, D):
 def millisecs_left(t, timeout):
     return int((timeout - t) * 1000)
 
-def obj_function(model, m, distances, y):
-    n = len(distances)
-    max_distance = 0
+def routes_objective(routes, distances):
+    from util import pad_routes, evaluate_routes
+    _, _, _, max_distance = evaluate_routes(pad_routes([routes]), distances)
+    return int(max_distance[0])
+
+def obj_function(model, m, distances, y, out_arcs):
+    n = len(distances) - 1
+    return routes_objective(extract_routes(lambda arc: is_true(model.evaluate(arc)), m, n, y, out_arcs), distances)
+
+def extract_routes(holds, m, n, y, out_arcs):
+    # Follows every route from the depot and only tests the arcs leaving the points
+    # it visits, every point is left through at most one true arc.
+    # holds(arc): whether the literal arc is true in the model (Z3 or PySAT)
+    # out_arcs[j]: successors of point j, the keys (j, k) of y[i], built with the model
+    routes = []
     for i in range(m):
-        total_distance = 0
-        for j in range(n):
-            for k in range(n):
-                if is_true(model.evaluate(y[i][j][k])):
-                    total_distance += distances[j][k]
-        max_distance = max(max_distance, total_distance)
-    return max_distance
+        route = []
+        current_node = n
+        while len(route) <= n:
+            current_node = next((k for k in out_arcs[current_node] if holds(y[i][current_node, k])), n)
+            if current_node == n:
+                break
+            route.append(current_node + 1)
+
+        routes.append(route)
+    return routes
 
 def output_to_dimacs(solver):
     # Create a goal and add the solver's assertions to it
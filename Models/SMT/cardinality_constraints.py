@@ -6,6 +6,8 @@ def at_least_one_seq(bool_vars):
 def at_most_one_seq(bool_vars, name):
     constraints = []
     n = len(bool_vars)
+    if n <= 1:
+        return BoolVal(True)
     s = [Bool(f"s_{name}_{i}") for i in range(n - 1)]
     constraints.append(Or(Not(bool_vars[0]), s[0]))
     constraints.append(Or(Not(bool_vars[n-1]), Not(s[n-2])))
@@ -0,0 +1,81 @@
+import sys
+import time
+import argparse
+from z3 import *
+from util import read_instances
+from campaign import parse_instances
+from bounds import lower_bound
+from preprocessing import heuristic_arcs, arc_lists
+from Models.SMT.smt_model import build_smt_model, build_smt_successors_model, smt_model
+
+# Size, encoding time and solving time of the SMT formulations, run from the root
+# of the repository:
+# python -m Models.SMT.formulation_stats --instances 1-21 --timeout 60
+# The formulations are encoded on the same arcs; the solving time is the one of a
+# full smt_model run.
+
+
+def build(m, n, l, s, D, arcs, formulation):
+    out_arcs, in_arcs = arc_lists(arcs)
+    if formulation == 'base':
+        return build_smt_model(m, n, s, l, D, out_arcs, in_arcs)
+    elif formulation == 'successors':
+        return build_smt_successors_model(m, n, s, l, D, out_arcs)
+    raise ValueError(f"Unknown SMT formulation: {formulation}")
+
+
+def count_constants(solver):
+    # Uninterpreted constants and functions declared by the formula
+    return sum(1 for line in solver.sexpr().splitlines() if line.startswith('(declare-'))
+
+
+def formulation_stats(file_name, formulation, arcs=None, timeout=None):
+    m, n, l, s, D = read_instances(file_name)
+    if arcs is None:
+        arcs = heuristic_arcs(m, n, l, s, D)
+
+    start_time = time.time()
+    solver = build(m, n, l, s, D, arcs, formulation)
+    encoding_time = time.time() - start_time
+
+    obj, solving_time = None, None
+    if timeout is not None:
+        obj, solving_time, _ = smt_model(m, n, s, l, D, implied_constraint=True, timeout_duration=timeout,
+                                         lower_bound=lower_bound(m, n, l, s, D), formulation=formulation)
+
+    return {
+        "n": n,
+        "m": m,
+        "constants": count_constants(solver),
+        "assertions": len(solver.assertions()),
+        "encoding_time": encoding_time,
+        "obj": obj,
+        "solving_time": solving_time
+    }
+
+
+def main(args):
+    parser = argparse.ArgumentParser(description='Compare the size and solving time of the SMT formulations.')
+    parser.add_argument('--instances', type=parse_instances, default=parse_instances('1-21'),
+                        help="Instances to encode, e.g. '1-10,13' (default: 1-21)")
+    parser.add_argument('--formulations', nargs='+', default=['base', 'successors'],
+                        help='Formulations to compare (default: base successors)')
+    parser.add_argument('--timeout', type=int, default=None,
+                        help='Also solve every instance with this timeout in seconds')
+    options = parser.parse_args(args)
+
+    print(f"{'instance':>8} {'formulation':>11} {'n':>4} {'m':>3} {'constants':>9} {'assertions':>10} {'encoding':>8} {'obj':>6} {'solving':>7}")
+    for instance in options.instances:
+        file_name = f'./Instances/inst{instance:02d}.dat'
+        m, n, l, s, D = read_instances(file_name)
+        arcs = heuristic_arcs(m, n, l, s, D)
+        for formulation in options.formulations:
+            stats = formulation_stats(file_name, formulation, arcs, options.timeout)
+            obj = '-' if stats["obj"] is None else stats["obj"]
+            solving = '-' if stats["solving_time"] is None else stats["solving_time"]
+            print(f"{instance:>8} {formulation:>11} {stats['n']:>4} {stats['m']:>3} {stats['constants']:>9} "
+                  f"{stats['assertions']:>10} {stats['encoding_time']:>8.2f} {obj:>6} {solving:>7}", flush=True)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
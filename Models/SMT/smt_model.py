@@ -1,14 +1,21 @@
 from z3 import *
 from .utils import *
 from .cardinality_constraints import *
+from Models.LNS.lns import heuristic_upper_bound
+from preprocessing import prune_arcs, arc_lists, capacity_classes
+from Models.SAT.logical_relation_constraints import value_precedence
+from Models.SAT.search import SEARCHES, TermBounds, minimize, optimize
 import time
 
-def smt_model(m, n, s, l, D,  implied_constraint = False, search='binary', timeout_duration = None):
-    start_time = time.time()
+def smt_variables(m, n, out_arcs):
+    x = [[Bool(f"x_{i}_{j}") for j in range(n)] for i in range(m)]  # x[i, j]: courier i delivers item j
+    y = [{(j, k): Bool(f"y_{i}_{j}_{k}") for j in range(n + 1) for k in out_arcs[j]} for i in range(m)]  # y[i][j, k]: courier i travels from j to k
+    max_distance = Int('max_distance')
+    return x, y, max_distance
 
+def build_smt_model(m, n, s, l, D, out_arcs, in_arcs, lower_bound = 0, symmetry_breaking = False, implied_constraint = False):
     # Decision variables
-    x = [[Bool(f"x_{i}_{j}") for j in range(n)] for i in range(m)]  # x[i, j]: courier i delivers item j
-    y = [[[Bool(f"y_{i}_{j}_{k}") for k in range(n + 1)] for j in range(n + 1)] for i in range(m)]  # y[i, j, k]: courier i travels from j to k
+    x, y, max_distance = smt_variables(m, n, out_arcs)
     u = [[Int(f"u_{i}_{j}") for j in range(n + 1)] for i in range(m)]  # u[i, j]: position of item j in the tour of courier i
 
     solver = Solver()
@@ -25,121 +32,201 @@ def smt_model(m, n, s, l, D,  implied_constraint = False, search='binary', timeo
     # 3. Route constraints: each courier's tour must start and end at the origin
     for i in range(m):
         # Start at the origin
-        solver.add(exactly_one_seq([y[i][n][k] for k in range(n)], f"start_{i}"))
+        solver.add(exactly_one_seq([y[i][n, k] for k in out_arcs[n]], f"start_{i}"))
         # End at the origin
-        solver.add(exactly_one_seq([y[i][k][n] for k in range(n)], f"end_{i}"))
+        solver.add(exactly_one_seq([y[i][k, n] for k in in_arcs[n]], f"end_{i}"))
     
         for j in range(n):
             # If a courier visits an item, it must leave that item
-            solver.add(Sum([If(y[i][j][k], 1, 0) for k in range(n + 1)]) == If(x[i][j], 1, 0))
+            solver.add(Sum([If(y[i][j, k], 1, 0) for k in out_arcs[j]]) == If(x[i][j], 1, 0))
             # If a courier arrives at an item, it must leave from that item
-            solver.add(Sum([If(y[i][k][j], 1, 0) for k in range(n + 1)]) == If(x[i][j], 1, 0))
+            solver.add(Sum([If(y[i][k, j], 1, 0) for k in in_arcs[j]]) == If(x[i][j], 1, 0))
 
-    # 4. Ensure no single-node loops
-    for i in range(m):
-        for j in range(n + 1):
-            solver.add(y[i][j][j] == False)
+    # 4. Single-node loops are never created, the preprocessing drops every j -> j arc
         
     # 5. Subtour elimination constraints (Miller-Tucker-Zemlin formulation)
     for i in range(m):
         for j in range(1, n + 1):
             solver.add(And(u[i][j] >= 1, u[i][j] <= n))
     
-        for j in range(n):
-            for k in range(n + 1):
-                if j != k:
-                    solver.add(Implies(y[i][j][k], u[i][j] + 1 == u[i][k]))
-                    
-        for k in range(n):
-            solver.add(Implies(y[i][n][k], u[i][k] == 1))
+        for (j, k), arc in y[i].items():
+            if j < n:
+                solver.add(Implies(arc, u[i][j] + 1 == u[i][k]))
+            else:
+                solver.add(Implies(arc, u[i][k] == 1))
     
-    # 6. Define the maximum distance traveled by any courier
+    # 6. Symmetry breaking: the couriers of a capacity class are interchangeable,
+    # their first items are ordered by value precedence
+    if symmetry_breaking:
+        for couriers in capacity_classes(l):
+            if len(couriers) > 1:
+                solver.add(value_precedence([x[i] for i in couriers], f"precedence_{couriers[0]}"))
+
+    # 7. Define the maximum distance traveled by any courier
+    distances = [Sum([If(arc, D[j][k], 0) for (j, k), arc in y[i].items()]) for i in range(m)]
+    for i in range(m):
+        solver.add(distances[i] <= max_distance)
+    solver.add(max_distance >= lower_bound)
+
+    # 8. Implied constraint: every courier delivers at least one item
+    if implied_constraint:
+        for i in range(m):
+            solver.add(at_least_one_seq(x[i]))
+
+    return solver
+
+def smt_successors_variables(m, n):
+    # Nodes 0..n-1 are the items, n + i and n + m + i the start and end depots of courier i
+    succ = [Int(f"succ_{v}") for v in range(n + m)]  # succ[v]: node visited after v
     max_distance = Int('max_distance')
+    return succ, max_distance
+
+def build_smt_successors_model(m, n, s, l, D, out_arcs, lower_bound = 0, symmetry_breaking = False):
+    # Same as the CP successors model: one successor per node, the courier and the
+    # position of a node are uninterpreted functions, so no variable is indexed by courier
+    succ, max_distance = smt_successors_variables(m, n)
+    courier = Function('courier', IntSort(), IntSort())
+    position = Function('position', IntSort(), IntSort())
+
+    def point(v):
+        # Row/column of node v in the distance matrix
+        return v if v < n else n
+
+    def successors(v):
+        # Nodes reachable from v through the kept arcs: items, and the end depots
+        # when v is an item that may close a route
+        items = [k for k in out_arcs[point(v)] if k < n]
+        ends = [n + m + i for i in range(m)] if v < n and n in out_arcs[v] else []
+        return items + ends
 
-    distances = [Sum([If(y[i][j][k], D[j][k], 0) for j in range(n + 1) for k in range(n + 1)]) for i in range(m)]
+    solver = Solver()
+
+    # 1. Every node has one successor, all of them different
+    for v in range(n + m):
+        solver.add(Or([succ[v] == k for k in successors(v)]))
+    solver.add(Distinct(succ))
+
+    # 2. The courier of a node is also the courier of its successor
     for i in range(m):
-        solver.add(distances[i] <= max_distance)
+        solver.add(courier(n + i) == i)
+        solver.add(courier(n + m + i) == i)
+    for v in range(n + m):
+        solver.add(courier(succ[v]) == courier(v))
+
+    # 3. Positions increase along a route, preventing sub-tours
+    for i in range(m):
+        solver.add(position(n + i) == 0)
+    for v in range(n + m):
+        solver.add(position(succ[v]) == position(v) + 1)
+
+    # 4. Load capacity constraints
+    for i in range(m):
+        solver.add(Sum([If(courier(j) == i, s[j], 0) for j in range(n)]) <= l[i])
+
+    # 5. The distance of an arc is looked up through an If-chain over the successor
+    cost = []
+    for v in range(n + m):
+        targets = successors(v)
+        arc_cost = D[point(v)][point(targets[-1])]
+        for k in reversed(targets[:-1]):
+            arc_cost = If(succ[v] == k, D[point(v)][point(k)], arc_cost)
+        cost.append(arc_cost)
+
+    # 6. Symmetry breaking: within a capacity class, a courier delivers item j
+    # only if the previous courier of the class delivers an item before j
+    if symmetry_breaking:
+        for couriers in capacity_classes(l):
+            if len(couriers) > 1:
+                delivers = [[courier(j) == i for j in range(n)] for i in couriers]
+                solver.add(value_precedence(delivers, f"precedence_{couriers[0]}"))
+
+    # Every courier delivers at least one item, the start depots have no end depot
+    # successor, so the implied constraint of build_smt_model holds by construction
+
+    # 7. Define the maximum distance traveled by any courier
+    for i in range(m):
+        distance = Sum([If(courier(j) == i, cost[j], 0) for j in range(n)]) + cost[n + i]
+        solver.add(distance <= max_distance)
+    solver.add(max_distance >= lower_bound)
+
+    return solver
+
+def extract_successor_routes(model, m, n, succ):
+    routes = []
+    for i in range(m):
+        route = []
+        v = model.evaluate(succ[n + i]).as_long()
+        while v < n and len(route) < n:
+            route.append(v + 1)
+            v = model.evaluate(succ[v]).as_long()
+        routes.append(route)
+    return routes
+
+def smt_model(m, n, s, l, D,  implied_constraint = False, search='binary', timeout_duration = None, incumbent = None, lower_bound = 0, heuristic_duration = 1, formulation = 'base', maxsat_engine = None, symmetry_breaking = False):
+    # formulation: 'base' (assignment and arc Booleans per courier) or 'successors' (one Int successor per node)
+    # search: 'linear' or 'binary' probe bounds with check(), 'optimize' minimizes max_distance with
+    # z3.Optimize, 'maxsat' gives a unit-weight soft constraint to every bound (MaxSMT, maxsat_engine)
+    if search not in SEARCHES:
+        raise ValueError(f"Input parameter [search] must be one of {SEARCHES}, was given '{search}'")
+    if formulation not in ['base', 'successors']:
+        raise ValueError(f"Unknown SMT formulation: {formulation}")
+    start_time = time.time()
+
+    # A routing found by a short heuristic run is the initial incumbent and upper bound
+    best_max_distance, best_routes = heuristic_upper_bound(m, n, s, l, D, heuristic_duration, lower_bound)
+    if incumbent is not None and best_routes is not None:
+        incumbent.publish(best_max_distance, best_routes, 'heuristic')
+    heuristic_time = time.time() - start_time
+
+    # Arcs that cannot appear in a routing better than the heuristic one are never encoded
+    arcs = prune_arcs(m, n, l, s, D, best_max_distance)
+    out_arcs, in_arcs = arc_lists(arcs)
+
+    if formulation == 'successors':
+        solver = build_smt_successors_model(m, n, s, l, D, out_arcs, lower_bound, symmetry_breaking)
+    else:
+        solver = build_smt_model(m, n, s, l, D, out_arcs, in_arcs, lower_bound, symmetry_breaking, implied_constraint)
+
+    if formulation == 'successors':
+        succ, max_distance = smt_successors_variables(m, n)
+        def decode(model):
+            routes = extract_successor_routes(model, m, n, succ)
+            return routes_objective(routes, D), routes
+    else:
+        _, y, max_distance = smt_variables(m, n, out_arcs)
+        def decode(model):
+            routes = extract_routes(lambda arc: is_true(model.evaluate(arc)), m, n, y, out_arcs)
+            return routes_objective(routes, D), routes
 
     encoding_time = time.time()
-    timeout = encoding_time + timeout_duration
-
-    low = 0
-    high = sum(max(row) for row in D)  # Initial upper bound
-
-    if search == 'linear':
-        solver.push()
-        solver.set('timeout', millisecs_left(time.time(), timeout))
-        while solver.check() == sat:
-            best_solution = solver.model()
-            best_max_distance = obj_function(best_solution, m, D, y)
-
-            if best_max_distance <= low:
-                break
-
-            high = best_max_distance - 1
-            solver.pop()
-            solver.push()
-
-            for i in range(m):
-                solver.add(max_distance <= high)
-            
-            now = time.time()
-            if now >= timeout:
-                break
-            solver.set('timeout', millisecs_left(now, timeout))
-
-    elif search == 'binary':
-        # Binary search for minimizing the maximum distance
-        best_solution = None
-        best_max_distance = None
-        while low <= high:
-            mid = (low + high) // 2
-            solver.push()
-            now = time.time()
-            if now >= timeout:
-                break
-            solver.set('timeout', millisecs_left(now, timeout)) 
-
-            solver.add(max_distance <= mid)
-            if solver.check() == sat:
-                best_solution = solver.model()
-                best_max_distance = obj_function(best_solution, m, D, y)
-                high = mid - 1
-            else:
-                low = mid + 1
-            solver.pop()
-            
+    timeout = encoding_time + timeout_duration - heuristic_time
+
+    low = lower_bound
+    high = sum(max(row) for row in D) if best_routes is None else best_max_distance - 1  # Initial upper bound
+
+    if search in ['optimize', 'maxsat']:
+        solver.add(max_distance <= high)
+        if search == 'optimize':
+            objective = max_distance
+        else:
+            # As many violated soft constraints as units of distance above low
+            objective = [(max_distance <= v, 1) for v in range(low, high)]
+        obj, routes, finished = optimize(solver, objective, decode, timeout, incumbent, 'smt', maxsat_engine)
+    else:
+        # Linear or binary search on max_distance, a timeout is never taken for unsat
+        bounds = TermBounds(solver, max_distance)
+        obj, routes, finished = minimize(solver, bounds, decode, low, high, search, timeout, incumbent, 'smt')
+    if routes is not None:
+        best_max_distance, best_routes = obj, routes
+
     end_time = time.time()
-    if end_time >= timeout:
+    if not finished or end_time >= timeout:
         solving_time = timeout_duration
     else:
-        solving_time = math.floor(end_time - encoding_time)
+        solving_time = math.floor(end_time - encoding_time + heuristic_time)
     
-    if best_solution is None:
+    if best_routes is None:
         ans = "N/A" if solving_time == timeout_duration else "UNSAT"
         return (ans, solving_time, None)
     else:
-        routes = []
-        for i in range(m):
-            arcs = []
-            for j in range(n + 1):
-                for k in range(n + 1):
-                    if is_true(best_solution.evaluate(y[i][j][k])):
-                        arcs.append((j + 1, k + 1))
-
-            route = []
-            current_node = n + 1
-            while arcs:
-                for arc in arcs:
-                    if arc[0] == current_node:
-                        route.append(arc[1])
-                        current_node = arc[1]
-                        arcs.remove(arc)
-                        break
-
-            if route and route[-1] == n + 1:
-                route.pop(-1)
-
-            routes.append(route)
-
-        return (best_max_distance, solving_time, routes)
+        return (best_max_distance, solving_time, best_routes)
@@ -0,0 +1,63 @@
+import math
+
+
+def shortest_paths(D):
+    # Floyd-Warshall, the distance matrix is not guaranteed to satisfy the triangle inequality
+    import numpy as np
+    sp = np.array(D, dtype=np.int64)
+    for k in range(sp.shape[0]):
+        sp = np.minimum(sp, sp[:, k:k + 1] + sp[k:k + 1, :])
+    return sp
+
+
+def round_trip_bound(n, D):
+    # Whichever courier delivers item i travels at least depot -> i -> depot
+    sp = shortest_paths(D)
+    return int((sp[n, :n] + sp[:n, n]).max()) if n > 0 else 0
+
+
+def min_couriers(l, s):
+    # Fewest couriers whose joint capacity can carry all the items
+    total = sum(s)
+    capacity = 0
+    for k, lk in enumerate(sorted(l, reverse=True), start=1):
+        capacity += lk
+        if capacity >= total:
+            return k
+    return len(l)
+
+
+def assignment_bound(m, n, l, s, D):
+    # Every item is entered and left exactly once and every used courier leaves
+    # and re-enters the depot once, so the total distance is at least the sum of
+    # the cheapest arcs; the longest of the m routes is at least their average.
+    import numpy as np
+    if n == 0:
+        return 0
+    D = np.array(D, dtype=np.int64)
+    masked = D + np.diag(np.full(n + 1, np.iinfo(np.int32).max))
+    k = min_couriers(l, s)
+    incoming = masked[:, :n].min(axis=0).sum() + k * masked[:n, n].min()
+    outgoing = masked[:n, :].min(axis=1).sum() + k * masked[n, :n].min()
+    return math.ceil(max(incoming, outgoing) / m)
+
+
+def lp_bound(file_name, model_name='three_index_vehicle_flow', solver_name='highs', timeout_seconds=60):
+    # LP relaxation of a MIP model, needs AMPL
+    from mcp import make_mip_instance
+    ampl, _, _, _, _, _ = make_mip_instance(file_name, model_name)
+    ampl.setOption('solver', solver_name)
+    ampl.setOption('relax_integrality', 1)
+    ampl.setOption(f'{solver_name}_options', f'time_limit={timeout_seconds}' if solver_name == 'highs' else f'timelimit={timeout_seconds}')
+    ampl.solve()
+    if ampl.get_value("solve_result") != "solved":
+        return 0
+    # Distances are integral, so is the optimal objective
+    return math.ceil(ampl.getObjective('MaxCourDist').value() - 1e-6)
+
+
+def lower_bound(m, n, l, s, D, file_name=None):
+    bound = max(round_trip_bound(n, D), assignment_bound(m, n, l, s, D))
+    if file_name is not None:
+        bound = max(bound, lp_bound(file_name))
+    return bound
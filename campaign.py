@@ -0,0 +1,170 @@
+import os
+import sys
+import json
+import time
+import signal
+import argparse
+import itertools
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from util import MethodType
+from Models.SAT.search import SEARCHES
+
+
+def parse_instances(spec):
+    # '1-10,13,16' -> [1, 2, ..., 10, 13, 16]
+    instances = []
+    for part in spec.split(','):
+        if '-' in part:
+            lower, upper = part.split('-')
+            instances.extend(range(int(lower), int(upper) + 1))
+        else:
+            instances.append(int(part))
+    return instances
+
+
+def parse_config(spec):
+    # 'method:model:solver[:option]' -> (method, model, solver, use_warm_start, search), where
+    # the option is 'true' for the MIP warm start and the search of the SAT and SMT models
+    fields = spec.split(':')
+    if len(fields) not in [3, 4]:
+        raise argparse.ArgumentTypeError(f"Invalid configuration '{spec}', expected method:model:solver[:option]")
+    method, model, solver = fields[:3]
+    MethodType(method)
+    option = fields[3] if len(fields) == 4 else None
+    if method in ['sat', 'smt']:
+        if option is not None and option not in SEARCHES:
+            raise argparse.ArgumentTypeError(f"Invalid search '{option}' in '{spec}', expected one of {SEARCHES}")
+        return method, model, solver, False, option
+    return method, model, solver, option == 'true', None
+
+
+def make_jobs(instances, configs, timeout_seconds):
+    jobs = []
+    for instance, (method, model, solver, use_warm_start, search) in itertools.product(instances, configs):
+        command = [sys.executable, 'mcp.py', f'./Instances/inst{instance:02d}.dat',
+                   method, model, solver, str(timeout_seconds)]
+        if use_warm_start:
+            command.append('true')
+        elif search is not None:
+            command.append(search)
+        jobs.append({
+            "instance": instance,
+            "method": method,
+            "model": model,
+            "solver": solver,
+            "use_warm_start": use_warm_start,
+            "search": search,
+            "command": command
+        })
+    return jobs
+
+
+def run_job(job, kill_after, log_dir):
+    # Every configuration of a job ends up in the name, so that concurrent jobs never share a log
+    option = '_warm' if job["use_warm_start"] else (f'_{job["search"]}' if job["search"] else '')
+    log_path = os.path.join(log_dir, f'{job["method"]}_{job["model"]}_{job["solver"]}{option}_{job["instance"]:02d}.log')
+    start_time = time.time()
+    with open(log_path, 'w') as log_file:
+        # Every job gets its own process group, so that a hard kill also reaches
+        # the solver processes spawned by MiniZinc and AMPL.
+        process = subprocess.Popen(job["command"], stdout=log_file, stderr=subprocess.STDOUT, start_new_session=True)
+        killed = False
+        try:
+            returncode = process.wait(timeout=kill_after)
+        except subprocess.TimeoutExpired:
+            os.killpg(process.pid, signal.SIGKILL)
+            returncode = process.wait()
+            killed = True
+    end_time = time.time()
+
+    return {
+        "instance": job["instance"],
+        "method": job["method"],
+        "model": job["model"],
+        "solver": job["solver"],
+        "use_warm_start": job["use_warm_start"],
+        "search": job["search"],
+        "status": "killed" if killed else ("ok" if returncode == 0 else "failed"),
+        "returncode": returncode,
+        "start": start_time,
+        "end": end_time,
+        "time": end_time - start_time,
+        "log": log_path
+    }
+
+
+def throughput(results, n_workers, wall_time):
+    if not results or wall_time <= 0:
+        return {}
+    times = sorted(result["time"] for result in results)
+    mean_time = sum(times) / len(times)
+    median_time = times[len(times) // 2]
+    return {
+        "jobs": len(results),
+        "workers": n_workers,
+        "wall_time": wall_time,
+        "mean_job_time": mean_time,
+        "median_job_time": median_time,
+        # Observed throughput includes the ramp-up and the tail of the campaign,
+        # the steady-state figure is what a fully loaded machine would sustain.
+        "jobs_per_hour": len(results) * 3600 / wall_time,
+        "steady_state_jobs_per_hour": n_workers * 3600 / mean_time if mean_time > 0 else None,
+        "jobs_per_hour_per_worker": 3600 / mean_time if mean_time > 0 else None
+    }
+
+
+def run_campaign(jobs, n_workers, kill_after, log_dir):
+    os.makedirs(log_dir, exist_ok=True)
+    results = []
+    start_time = time.time()
+    with ThreadPoolExecutor(max_workers=n_workers) as executor:
+        futures = [executor.submit(run_job, job, kill_after, log_dir) for job in jobs]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            print(f'[{len(results)}/{len(jobs)}] inst{result["instance"]:02d} '
+                  f'{result["method"]} {result["model"]} {result["solver"]}: '
+                  f'{result["status"]} ({result["time"]:.2f} seconds)')
+    wall_time = time.time() - start_time
+
+    results.sort(key=lambda result: (result["method"], result["model"], result["solver"], result["instance"]))
+    return results, throughput(results, n_workers, wall_time)
+
+
+def main(args):
+    parser = argparse.ArgumentParser(description='Run a benchmark campaign of mcp.py jobs in parallel.')
+    parser.add_argument('configs', nargs='+', type=parse_config,
+                        help="Configurations as method:model:solver[:option], e.g. cp:successors:gecode or sat:base:Z3:maxsat")
+    parser.add_argument('--instances', type=parse_instances, default=parse_instances('1-21'),
+                        help="Instances to run, e.g. '1-10,13' (default: 1-21)")
+    parser.add_argument('--jobs', type=int, default=os.cpu_count(),
+                        help='Maximum number of concurrent jobs (default: number of cores)')
+    parser.add_argument('--timeout', type=int, default=275,
+                        help='Timeout in seconds given to the solver (default: 275)')
+    parser.add_argument('--kill-after', type=int, default=300,
+                        help='Hard wall-clock limit in seconds after which a job is killed (default: 300)')
+    parser.add_argument('--log-dir', default='./logs',
+                        help='Directory for the output of every job (default: ./logs)')
+    parser.add_argument('--output', default='./campaign.json',
+                        help='File collecting the status and timings of every job (default: ./campaign.json)')
+    options = parser.parse_args(args)
+
+    jobs = make_jobs(options.instances, options.configs, options.timeout)
+    print(f"Running {len(jobs)} jobs on {options.jobs} workers")
+    results, summary = run_campaign(jobs, options.jobs, options.kill_after, options.log_dir)
+
+    with open(options.output, 'w') as json_file:
+        json.dump({"summary": summary, "jobs": results}, json_file, indent=4)
+
+    print(f"\n{'='*50}")
+    for status in ["ok", "failed", "killed"]:
+        print(f"{status}: {sum(result['status'] == status for result in results)}")
+    for key, value in summary.items():
+        print(f"{key}: {value:.2f}" if isinstance(value, float) else f"{key}: {value}")
+    print(f"Campaign results written to {options.output}")
+    print(f"{'='*50}\n")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,68 @@
+import os
+import time
+import json
+import hashlib
+
+CACHE_DIR = './cache'
+# Bumped whenever an encoding changes, so stale formulas are never reloaded
+CACHE_VERSION = 3
+
+
+def formula_key(kind, m, n, l, s, D, arcs, **options):
+    # Hash of the instance, the kept arcs and every option that changes the formula
+    content = {
+        'version': CACHE_VERSION,
+        'kind': kind,
+        'instance': [m, n, list(l), list(s), [list(row) for row in D]],
+        'arcs': [[bool(a) for a in row] for row in arcs],
+        'options': options
+    }
+    return f"{kind}_{hashlib.sha256(json.dumps(content, sort_keys=True).encode()).hexdigest()[:16]}"
+
+
+def save_cnf(path, store):
+    # ClauseStore as binary arrays: the clauses back to back, 0-terminated as in
+    # DIMACS, and the names of the model variables packed into one byte array
+    import numpy as np
+    ids = [v for v, name in enumerate(store.names) if name is not None]
+    names = '\n'.join(store.names[v] for v in ids).encode()
+    np.savez(path, num_vars=store.num_vars, num_clauses=store.num_clauses,
+             clauses=np.frombuffer(store.clauses, dtype=np.int32), ids=np.array(ids, dtype=np.int32),
+             names=np.frombuffer(names, dtype=np.uint8))
+
+
+def load_cnf(path):
+    from array import array
+    from Models.SAT.clause_store import ClauseStore
+    import numpy as np
+    data = np.load(path)
+    store = ClauseStore()
+    store.names = [None] * (int(data['num_vars']) + 1)
+    names = data['names'].tobytes().decode().split('\n') if len(data['names']) else []
+    for v, name in zip(data['ids'].tolist(), names):
+        store.names[v] = name
+    store.clauses = array('i', data['clauses'].astype(np.int32).tobytes())
+    store.num_clauses = int(data['num_clauses'])
+    return store
+
+
+def cached_formula(key, build, cache_dir=CACHE_DIR):
+    # ClauseStore of the formula of key, reloaded from the cache when it was already
+    # encoded, otherwise built with build() and stored for the next runs
+    path = os.path.join(cache_dir, key + '.npz')
+
+    start_time = time.time()
+    if os.path.exists(path):
+        store = load_cnf(path)
+        print(f"Formula cache hit: {key} loaded in {time.time() - start_time:.2f}s")
+        return store
+
+    store = build()
+    encoding_time = time.time() - start_time
+    # Written aside and renamed, runs of a campaign may store the same formula concurrently
+    os.makedirs(cache_dir, exist_ok=True)
+    partial_path = os.path.join(cache_dir, f"{key}.{os.getpid()}.npz")
+    save_cnf(partial_path, store)
+    os.replace(partial_path, path)
+    print(f"Formula cache miss: {key} encoded in {encoding_time:.2f}s, stored in {time.time() - start_time - encoding_time:.2f}s")
+    return store
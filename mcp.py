@@ -7,20 +7,22 @@ from util import (MethodType,
                   extract_integer_from_filename,
                   write_json_file,
                   make_initial_routes)
+from bounds import lower_bound
+from preprocessing import heuristic_arcs
 
 def print_usage():
-    print("Usage: python mcp.py <file_name> <model_type> <model_name> <solver_name> <timeout_seconds> [use_warm_start]")
+    print("Usage: python mcp.py <file_name> <model_type> <model_name> <solver_name> <timeout_seconds> [option]")
     print("  <file_name>: Path to the instance file")
-    print("  <model_type>: 'cp', 'sat', 'smt' or 'mip'")
-    print("  <model_name>: Name of the model to use")
-    print("  <solver_name>: Name of the solver to use")
+    print("  <model_type>: 'cp', 'sat', 'smt', 'mip', 'lns' or 'portfolio'")
+    print("  <model_name>: Name of the model to use ('all' or a comma-separated list of 'cp', 'sat', 'smt', 'mip' for portfolio)")
+    print("  <solver_name>: Name of the solver to use ('default' for portfolio, 'default' or a random seed for lns)")
     print("  <timeout_seconds>: Timeout in seconds")
-    print("  [use_warm_start]: Optional. 'true' to use warm start (only applicable for HiGHS solver in MIP)")
+    print("  [option]: Optional. For 'mip', 'true' to use warm start (only applicable for HiGHS solver)")
+    print("            For 'sat' and 'smt', the search: 'linear', 'binary', 'optimize' or 'maxsat'")
 
 
-def solve_with_cp(file_name, model_name, solver_name, timeout_seconds):
-    from minizinc import Model, Solver, Instance, Status
-    from datetime import timedelta
+def make_cp_instance(file_name, model_name, solver_name):
+    from minizinc import Model, Solver, Instance
     m, n, l, s, D = read_instances(file_name)
     model = Model(f'./Models/CP/{model_name}.mzn')
     solver = Solver.lookup(solver_name)
@@ -31,6 +33,44 @@ def solve_with_cp(file_name, model_name, solver_name, timeout_seconds):
     instance["l"] = l
     instance["s"] = s
     instance["D"] = expand_matrix(D, m)
+    bound = lower_bound(m, n, l, s, D)
+    instance["LB"] = bound
+
+    # Successors of the expanded matrix through the arcs kept by the preprocessing
+    if model_name.startswith('successors'):
+        arcs = heuristic_arcs(m, n, l, s, D, lower_bound=bound)
+        end_depots = list(range(n + m + 1, n + 2 * m + 1))
+        for j in range(n + 1):
+            allowed = [k + 1 for k in range(n) if arcs[j][k]]
+            if j == n:
+                # Start depots, empty routes go straight to an end depot
+                for i in range(n + 1, n + m + 1):
+                    instance.add_string(f"constraint successors[{i}] in {{{', '.join(map(str, allowed + end_depots))}}};")
+            else:
+                allowed += end_depots if arcs[j][n] else []
+                instance.add_string(f"constraint successors[{j + 1}] in {{{', '.join(map(str, allowed))}}};")
+    return instance, m, n
+
+
+def extract_cp_routes(successors, m, n):
+    def extract_route(k):
+        route = []
+        curr = n + k
+        while True:
+            if curr <= n:
+                route.append(curr)
+            curr = successors[curr - 1]
+            if curr == 0:
+                break
+        return route
+
+    return [extract_route(i) for i in range(1, m+1)]
+
+
+def solve_with_cp(file_name, model_name, solver_name, timeout_seconds):
+    from minizinc import Status
+    from datetime import timedelta
+    instance, m, n = make_cp_instance(file_name, model_name, solver_name)
 
     print(f"n={n}, m={m}")
 
@@ -48,20 +88,7 @@ def solve_with_cp(file_name, model_name, solver_name, timeout_seconds):
         optimal = result.status == Status.OPTIMAL_SOLUTION
         obj = result["objective"]
 
-        successors = result["successors"]
-
-        def extract_route(k):
-            route = []
-            curr = n + k
-            while True:
-                if curr <= n:
-                    route.append(curr)
-                curr = successors[curr - 1]
-                if curr == 0:
-                    break
-            return route
-
-        sol = [extract_route(i) for i in range(1, m+1)]
+        sol = extract_cp_routes(result["successors"], m, n)
 
         print_result(solving_time, optimal, obj, sol, True)
         print(result.statistics)
@@ -82,40 +109,58 @@ def solve_with_sat(file_name, model_name, solver, timeout_seconds, search='binar
     from Models.SAT.sat_model import sat_model
     m, n, l, s, D = read_instances(file_name)
 
+    # Models differ in the encoding of the positions used to prevent sub-tours,
+    # the _SB variants break the symmetries between couriers of equal capacity
+    position_encodings = {'base': 'onehot', 'log': 'binary'}
+    symmetry_breaking = model_name.endswith('_SB')
+    position_encoding = position_encodings.get(model_name.removesuffix('_SB'))
+    if position_encoding is None:
+        raise ValueError(f"Unknown model: {model_name}")
+
     if solver == 'Z3':
-        obj, time, sol = sat_model(m, n, s, l, D, symmetry_breaking=False, implied_constraint=True, timeout_duration=timeout_seconds)
-    elif solver == 'glucose':
-        obj, time, sol = None, timeout_seconds, None
-    elif solver == 'minisat':
-        obj, time, sol = None, timeout_seconds, None
+        obj, time, sol = sat_model(m, n, s, l, D, symmetry_breaking=symmetry_breaking, implied_constraint=True, search=search, timeout_duration=timeout_seconds,
+                                   lower_bound=lower_bound(m, n, l, s, D), position_encoding=position_encoding)
+    elif solver in ['glucose', 'minisat']:
+        from Models.SAT.pysat_solver import pysat_model
+        obj, time, sol = pysat_model(m, n, s, l, D, solver, symmetry_breaking=symmetry_breaking, implied_constraint=True, search=search, timeout_duration=timeout_seconds,
+                                     lower_bound=lower_bound(m, n, l, s, D), position_encoding=position_encoding)
     else:
         raise ValueError(f"Unknown solver: {solver}")
 
     optimal = time < timeout_seconds
+    if sol is None:
+        print_result(time, "unsatisfiable" if obj == "UNSAT" else "unknown", None, None, False)
+        return
     instance = extract_integer_from_filename(file_name)
     write_json_file(f'{model_name}_{solver}_{search}', obj, time, optimal, sol, f'./res/SAT/{instance}.json')
 
 def solve_with_smt(file_name, model_name, solver, timeout_seconds, search='linear'):
     from Models.SMT.smt_model import smt_model
     m, n, l, s, D = read_instances(file_name)
-    
+
+    # Models differ in the formulation: Booleans per courier and arc, or one integer successor per node,
+    # the _SB variants break the symmetries between couriers of equal capacity
+    symmetry_breaking = model_name.endswith('_SB')
+    formulation = model_name.removesuffix('_SB')
+    if formulation not in ['base', 'successors']:
+        raise ValueError(f"Unknown model: {model_name}")
+
     if solver == 'Z3':
-        obj, time, sol = smt_model(m, n, s, l, D, implied_constraint = True, search=search, timeout_duration=timeout_seconds)
+        obj, time, sol = smt_model(m, n, s, l, D, implied_constraint = True, search=search, timeout_duration=timeout_seconds,
+                                   lower_bound=lower_bound(m, n, l, s, D), formulation=formulation, symmetry_breaking=symmetry_breaking)
     else:
         raise ValueError(f"Unknown solver: {solver}")
 
     optimal = time < timeout_seconds
+    if sol is None:
+        print_result(time, "unsatisfiable" if obj == "UNSAT" else "unknown", None, None, False)
+        return
     instance = extract_integer_from_filename(file_name)
     write_json_file(f'{model_name}_{solver}_{search}', obj, time, optimal, sol, f'./res/SMT/{instance}.json')
 
-def solve_with_mip(
-        file_name,
-        model_name,
-        solver_name,
-        timeout_seconds,
-        use_warm_start=False
-        ):
+def make_mip_instance(file_name, model_name):
     from amplpy import AMPL, modules
+    import numpy as np
     import os
     modules.activate(os.environ["AMPL_LICENSE"])
     m, n, c, s, D = read_instances(file_name)
@@ -123,50 +168,21 @@ def solve_with_mip(
     ampl = AMPL()
     ampl.read(f'./Models/MIP/{model_name}.mod')
 
+    # The data is sent as whole arrays, in the order of the indexing sets
     ampl.param['n'] = n
     ampl.param['m'] = m
-    ampl.param['d'] = {(i + 1, j + 1): D[i][j] for i in range(n + 1) for j in range(n + 1)}
-    ampl.param['s'] = {i + 1: s[i] for i in range(n)}
-    ampl.param['c'] = {k + 1: c[k] for k in range(m)}
+    ampl.param['d'] = np.asarray(D)
+    ampl.param['s'] = np.asarray(s)
+    ampl.param['c'] = np.asarray(c)
+    bound = lower_bound(m, n, c, s, D)
+    ampl.param['lb'] = bound
+
+    arcs = heuristic_arcs(m, n, c, s, D, lower_bound=bound)
+    ampl.set['A'] = np.argwhere(arcs) + 1
+    return ampl, m, n, c, s, D
 
-    def solve():
-        if use_warm_start:
-            greedy_routes = make_initial_routes(n, c, s, D)
-            print('=' * 50)
-            print("Greedy routes:", greedy_routes)
-
-            x = ampl.getVariable('x')
-            y = ampl.getVariable('y')
-            u = ampl.getVariable('u')
-            maxCourDist = ampl.getVariable('maxCourDist')
-
-            depot = n + 1
-            max_route_length = 0
-            for k in range(1, m + 1):
-                routes = greedy_routes.get(k, [[]])
-                route_length = 0
-                prev_node = depot
-                y[depot, k].setValue(1)
-
-                for route in routes:
-                    if not route:
-                        continue
-
-                    for i, curr_node in enumerate(route, start=1):
-                        y[curr_node, k].setValue(1)
-                        x[prev_node, curr_node, k].setValue(1)
-                        u[curr_node, k].setValue(i)
-                        route_length += D[prev_node - 1][curr_node - 1]
-                        prev_node = curr_node
-                    x[route[-1], depot, k].setValue(1)  # Return to depot
-                    route_length += D[route[-1] - 1][depot - 1]
-
-                max_route_length = max(max_route_length, route_length)
-            print("Greedy obj:", max_route_length)
-            print('=' * 50)
-            maxCourDist.setValue(max_route_length)
-        ampl.solve()
 
+def set_mip_options(ampl, solver_name, timeout_seconds, use_warm_start=False):
     ampl.setOption('solver', solver_name)
     warmstart = 1 if use_warm_start else 0
 
@@ -179,36 +195,178 @@ def solve_with_mip(
     elif solver_name == 'gcg':
         ampl.setOption(f'{solver_name}_options', f'timelimit={timeout_seconds} outlev=1')
 
-    _, solving_time = measure_solve_time(solve)
-    solve_result = ampl.get_value("solve_result")
-    obj = ampl.getObjective('MaxCourDist').value()
-    optimal = solve_result == "solved"
 
-    x = ampl.getVariable('x').getValues().toDict()
+def set_mip_warm_start(ampl, m, n, c, s, D):
+    # Greedy routes as initial values of x, y, u and maxCourDist, each variable set in one call
+    greedy_routes = make_initial_routes(n, c, s, D)
+    print('=' * 50)
+    print("Greedy routes:", greedy_routes)
+
+    arcs = set(tuple(arc) for arc in ampl.getSet('A').getValues().toList())
+    depot = n + 1
+    x_start, y_start, u_start = {}, {}, {}
+    max_route_length = 0
+    for k in range(1, m + 1):
+        routes = greedy_routes.get(k, [[]])
+        route_length = 0
+        prev_node = depot
+        y_start[depot, k] = 1
+
+        for route in routes:
+            if not route:
+                continue
+
+            for i, curr_node in enumerate(route, start=1):
+                y_start[curr_node, k] = 1
+                if (prev_node, curr_node) in arcs:
+                    x_start[prev_node, curr_node, k] = 1
+                u_start[curr_node, k] = i
+                route_length += D[prev_node - 1][curr_node - 1]
+                prev_node = curr_node
+            if (route[-1], depot) in arcs:
+                x_start[route[-1], depot, k] = 1  # Return to depot
+            route_length += D[route[-1] - 1][depot - 1]
+
+        max_route_length = max(max_route_length, route_length)
+    print("Greedy obj:", max_route_length)
+    print('=' * 50)
+
+    ampl.getVariable('x').setValues(x_start)
+    ampl.getVariable('y').setValues(y_start)
+    if 'u' in dict(ampl.getVariables()):  # The _cuts models have no MTZ positions
+        ampl.getVariable('u').setValues(u_start)
+    ampl.getVariable('maxCourDist').setValue(max_route_length)
+
+
+def mip_successors(ampl, m):
+    # Only the arcs in use are read back, as (i, j, k, value) rows:
+    # successors[k][i] is the node courier k visits after i
+    used = ampl.getData('{(i, j) in A, k in K: x[i, j, k] > 0.5} x[i, j, k]').toList()
+    successors = [{} for _ in range(m + 1)]
+    for i, j, k, _ in used:
+        successors[int(k)][int(i)] = int(j)
+    return successors
+
+
+def extract_mip_routes(ampl, m, n, successors=None):
+    # Every route follows the successors from the depot
+    if successors is None:
+        successors = mip_successors(ampl, m)
     sol = []
     depot = n + 1
-
-    # Extract solution
     for k in range(1, m + 1):
         route = []
-        curr_node = depot
+        curr_node = successors[k].get(depot, depot)
+        while curr_node != depot and len(route) < n:
+            route.append(curr_node)
+            curr_node = successors[k].get(curr_node, depot)
+        sol.append(route)
+    return sol
 
-        while True:
-            next_node = None
-            for j in range(1, depot):
-                if (curr_node, j, k) in x and x[(curr_node, j, k)] > 0.5:
-                    next_node = j
-                    break
 
-            if next_node is None or next_node == depot:
-                break
+def find_subtours(ampl, m, n):
+    # Item sets of the cycles that do not go through the depot, in any route
+    successors = mip_successors(ampl, m)
+    routes = extract_mip_routes(ampl, m, n, successors)
+    subtours = []
+    for k in range(1, m + 1):
+        unvisited = set(successors[k]) - set(routes[k - 1]) - {n + 1}
+        while unvisited:
+            node = unvisited.pop()
+            cycle = {node}
+            node = successors[k][node]
+            while node not in cycle:
+                cycle.add(node)
+                unvisited.discard(node)
+                node = successors[k][node]
+            subtours.append(cycle)
+    return subtours
+
+
+def solve_row_generation(ampl, m, n, solver_name, timeout_seconds, use_warm_start=False):
+    # Models without sub-tour elimination rows (_cuts): solve, add a subtour
+    # elimination and a capacity cut for the items of every cycle that misses the
+    # depot, and solve again. Returns False when the time runs out before a
+    # solution without subtours is found.
+    import math
+    import time
+    end_time = time.time() + timeout_seconds
+    cuts = 0
+    while True:
+        set_mip_options(ampl, solver_name, max(1, math.ceil(end_time - time.time())), use_warm_start)
+        ampl.solve()
+        if ampl.get_value("solve_result") in ["infeasible", "unbounded"]:
+            return True
 
-            route.append(next_node)
-            curr_node = next_node
+        subtours = find_subtours(ampl, m, n)
+        print(f"Row generation: {len(subtours)} subtours found, {cuts} cuts so far")
+        if not subtours:
+            return True
+        if time.time() >= end_time:
+            return False
 
-        sol.append(route)
+        for subtour in subtours:
+            cuts += 1
+            ampl.param['nCuts'] = cuts
+            ampl.set['CUT'][cuts] = sorted(subtour)
+
+
+def solve_with_branch_and_price(file_name, solver_name, timeout_seconds):
+    from Models.MIP.branch_and_price import branch_and_price
+    m, n, c, s, D = read_instances(file_name)
+
+    obj, solving_time, optimal, sol = branch_and_price(m, n, s, c, D, solver_name, timeout_seconds)
+    if sol is None:
+        print_result(solving_time, "unknown", None, None, False)
+        return
+    print_result(solving_time, "solved" if optimal else "limit", obj, sol, True)
+
+    instance = extract_integer_from_filename(file_name)
+    write_json_file(f'branch_and_price_{solver_name}',
+                    obj,
+                    solving_time,
+                    optimal,
+                    sol,
+                    f'./res/MIP/{instance}.json')
 
-    if solve_result in ["infeasible", "unbounded"] or solving_time > 300 or obj == 0.0 or all(len(route) == 0 for route in sol):
+
+def solve_with_mip(
+        file_name,
+        model_name,
+        solver_name,
+        timeout_seconds,
+        use_warm_start=False
+        ):
+    import time
+    if model_name == 'branch_and_price':
+        # Column generation on the set partitioning master, not a .mod of its own
+        solve_with_branch_and_price(file_name, solver_name, timeout_seconds)
+        return
+
+    # Model setup and solution extraction are timed apart from the solver
+    start_time = time.time()
+    ampl, m, n, c, s, D = make_mip_instance(file_name, model_name)
+    if use_warm_start:
+        set_mip_warm_start(ampl, m, n, c, s, D)
+    set_mip_options(ampl, solver_name, timeout_seconds, use_warm_start)
+    setup_time = time.time() - start_time
+
+    def solve():
+        # The _cuts models add their sub-tour elimination rows between solves
+        if model_name.endswith('_cuts'):
+            return solve_row_generation(ampl, m, n, solver_name, timeout_seconds, use_warm_start)
+        ampl.solve()
+        return True
+    valid, solving_time = measure_solve_time(solve)
+    solve_result = ampl.get_value("solve_result")
+    obj = ampl.getObjective('MaxCourDist').value()
+    optimal = solve_result == "solved"
+
+    # Extract solution
+    sol, extraction_time = measure_solve_time(lambda: extract_mip_routes(ampl, m, n))
+    print(f"MIP setup: {setup_time:.2f}s, solver: {solving_time:.2f}s, extraction: {extraction_time:.2f}s")
+
+    if not valid or solve_result in ["infeasible", "unbounded"] or solving_time > 300 or obj == 0.0 or all(len(route) == 0 for route in sol):
         print_result(solving_time, solve_result, obj, sol, False)
         return
     print_result(solving_time, solve_result, obj, sol, True)
@@ -223,6 +381,60 @@ def solve_with_mip(
                     f'./res/MIP/{instance}.json')
 
 
+def solve_with_lns(file_name, model_name, solver_name, timeout_seconds):
+    import os
+    from Models.LNS.lns import lns
+    m, n, l, s, D = read_instances(file_name)
+
+    if model_name != 'base':
+        raise ValueError(f"Unknown model: {model_name}")
+    seed = 0 if solver_name == 'default' else int(solver_name)
+
+    bound = lower_bound(m, n, l, s, D)
+    obj, solving_time, sol = lns(m, n, s, l, D, timeout_seconds, seed=seed, lower_bound=bound, verbose=True)
+    if sol is None:
+        print_result(solving_time, "no feasible routing found", None, None, False)
+        return
+    # Large neighbourhood search proves optimality only by reaching the lower bound
+    optimal = obj <= bound
+    print_result(solving_time, "optimal" if optimal else "best found", obj, sol, True)
+
+    os.makedirs('./res/LNS', exist_ok=True)
+    instance = extract_integer_from_filename(file_name)
+    write_json_file(f'{model_name}_{solver_name}',
+                    obj,
+                    solving_time,
+                    optimal,
+                    sol,
+                    f'./res/LNS/{instance}.json')
+
+
+def solve_with_portfolio(file_name, model_name, solver_name, timeout_seconds):
+    import os
+    from portfolio import PORTFOLIO_MEMBERS, run_portfolio
+
+    members = list(PORTFOLIO_MEMBERS) if model_name == 'all' else model_name.split(',')
+    for member in members:
+        if member not in PORTFOLIO_MEMBERS:
+            raise ValueError(f"Unknown portfolio member: {member}")
+
+    obj, solving_time, optimal, sol, winner = run_portfolio(file_name, members, timeout_seconds)
+
+    if sol is None:
+        print_result(solving_time, "unknown", None, None, False)
+        return
+    print_result(solving_time, f"optimal ({winner})" if optimal else f"best found ({winner})", obj, sol, True)
+
+    os.makedirs('./res/PORTFOLIO', exist_ok=True)
+    instance = extract_integer_from_filename(file_name)
+    write_json_file(f'portfolio_{model_name.replace(",", "_")}',
+                    obj,
+                    solving_time,
+                    optimal,
+                    sol,
+                    f'./res/PORTFOLIO/{instance}.json')
+
+
 if __name__ == "__main__":
     if len(sys.argv) not in [6, 7]:
         print_usage()
@@ -233,17 +445,21 @@ if __name__ == "__main__":
         model_name = sys.argv[3]
         solver_name = sys.argv[4]
         timeout_seconds = int(sys.argv[5])
-        use_warm_start = sys.argv[6] == 'true' if len(sys.argv) == 7 else False
+        option = sys.argv[6] if len(sys.argv) == 7 else None
 
         if model_type == MethodType.CP:
             solve_with_cp(file_name, model_name, solver_name, timeout_seconds)
         elif model_type == MethodType.SAT:
-            solve_with_sat(file_name, model_name, solver_name, timeout_seconds)
+            solve_with_sat(file_name, model_name, solver_name, timeout_seconds, search=option or 'binary')
         elif model_type == MethodType.SMT:
-            solve_with_smt(file_name, model_name, solver_name, timeout_seconds)
+            solve_with_smt(file_name, model_name, solver_name, timeout_seconds, search=option or 'linear')
         elif model_type == MethodType.MIP:
             solve_with_mip(file_name, model_name, solver_name, timeout_seconds,
-                           use_warm_start=use_warm_start)
+                           use_warm_start=option == 'true')
+        elif model_type == MethodType.LNS:
+            solve_with_lns(file_name, model_name, solver_name, timeout_seconds)
+        elif model_type == MethodType.PORTFOLIO:
+            solve_with_portfolio(file_name, model_name, solver_name, timeout_seconds)
     except Exception as e:
         print(f"An error occurred: {e}")
         print_usage()
@@ -0,0 +1,200 @@
+import os
+import time
+import queue
+import signal
+import multiprocessing as mp
+from util import read_instances
+from bounds import lower_bound
+
+# Method -> (model_name, solver_name) raced by the portfolio
+PORTFOLIO_MEMBERS = {
+    'cp': ('successors_best', 'gecode'),
+    'sat': ('base', 'Z3'),
+    'smt': ('base', 'Z3'),
+    'mip': ('three_index_vehicle_flow', 'highs')
+}
+
+# Seconds between two checks of the shared incumbent by the CP member
+POLL_INTERVAL = 0.5
+
+
+class SharedIncumbent:
+    # Best objective shared between the processes of a portfolio. Every improving
+    # solution is also sent to the parent process, which keeps the best routes.
+    def __init__(self):
+        self.value = mp.Value('l', -1)
+        self.solutions = mp.Queue()
+        self.optimal = mp.Event()
+
+    def bound(self):
+        value = self.value.value
+        return None if value < 0 else value
+
+    def publish(self, obj, sol, source):
+        obj = round(obj)
+        with self.value.get_lock():
+            if 0 <= self.value.value <= obj:
+                return False
+            self.value.value = obj
+        print(f"[portfolio] {source} found a new incumbent: {obj}")
+        self.solutions.put((obj, sol, source))
+        return True
+
+    def prove_optimal(self, source):
+        print(f"[portfolio] {source} proved optimality")
+        self.solutions.put((None, None, source))
+        self.optimal.set()
+
+
+def run_cp_member(incumbent, file_name, timeout_seconds):
+    # The CP search is restarted with the shared incumbent as a cutoff whenever
+    # another member improves on the best solution it knows
+    import asyncio
+    from datetime import timedelta
+    from minizinc import Status
+    from mcp import make_cp_instance, extract_cp_routes
+
+    model_name, solver_name = PORTFOLIO_MEMBERS['cp']
+    deadline = time.time() + timeout_seconds
+    best = None  # Best objective known to the running search, its own or the cutoff
+
+    async def solve(cutoff):
+        nonlocal best
+        instance, m, n = make_cp_instance(file_name, model_name, solver_name)
+        if cutoff is not None:
+            instance.add_string(f"constraint max(distances) < {cutoff};")
+        async for result in instance.solutions(timeout=timedelta(seconds=max(1, deadline - time.time())),
+                                               intermediate_solutions=True,
+                                               free_search=solver_name == 'chuffed'):
+            if result.solution is not None:
+                best = result["objective"]
+                incumbent.publish(best, extract_cp_routes(result["successors"], m, n), 'cp')
+            # Unsatisfiable under the cutoff means that the incumbent is optimal
+            if result.status in [Status.OPTIMAL_SOLUTION, Status.UNSATISFIABLE]:
+                incumbent.prove_optimal('cp')
+
+    async def improved():
+        # Returns the shared incumbent once it beats the best objective of the search
+        while True:
+            await asyncio.sleep(POLL_INTERVAL)
+            bound = incumbent.bound()
+            if bound is not None and (best is None or bound < best):
+                return bound
+
+    async def race():
+        nonlocal best
+        cutoff = incumbent.bound()
+        while time.time() < deadline:
+            best = cutoff
+            search = asyncio.create_task(solve(cutoff))
+            watcher = asyncio.create_task(improved())
+            done, _ = await asyncio.wait([search, watcher], return_when=asyncio.FIRST_COMPLETED)
+            # Cancelling the search also terminates the MiniZinc process
+            for task in [search, watcher]:
+                task.cancel()
+            await asyncio.gather(search, watcher, return_exceptions=True)
+            if search in done:
+                search.result()
+                return
+            cutoff = watcher.result()
+            print(f"[portfolio] cp restarts with the cutoff {cutoff}")
+
+    asyncio.run(race())
+
+
+def run_sat_member(incumbent, file_name, timeout_seconds):
+    from Models.SAT.sat_model import sat_model
+    m, n, l, s, D = read_instances(file_name)
+    _, time, _ = sat_model(m, n, s, l, D, implied_constraint=True, search='binary',
+                           timeout_duration=timeout_seconds, incumbent=incumbent,
+                           lower_bound=lower_bound(m, n, l, s, D))
+    if time < timeout_seconds:
+        incumbent.prove_optimal('sat')
+
+
+def run_smt_member(incumbent, file_name, timeout_seconds):
+    from Models.SMT.smt_model import smt_model
+    m, n, l, s, D = read_instances(file_name)
+    _, time, _ = smt_model(m, n, s, l, D, implied_constraint=True, search='binary',
+                           timeout_duration=timeout_seconds, incumbent=incumbent,
+                           lower_bound=lower_bound(m, n, l, s, D))
+    if time < timeout_seconds:
+        incumbent.prove_optimal('smt')
+
+
+def run_mip_member(incumbent, file_name, timeout_seconds):
+    # The MIP only publishes its solutions: amplpy cannot interrupt a running
+    # solve, so it never receives the incumbent of the other members
+    from mcp import make_mip_instance, set_mip_options, extract_mip_routes
+
+    model_name, solver_name = PORTFOLIO_MEMBERS['mip']
+    ampl, m, n, _, _, _ = make_mip_instance(file_name, model_name)
+    set_mip_options(ampl, solver_name, timeout_seconds)
+    ampl.solve()
+
+    solve_result = ampl.get_value("solve_result")
+    if solve_result in ["solved", "limit"]:
+        sol = extract_mip_routes(ampl, m, n)
+        if any(len(route) > 0 for route in sol):
+            incumbent.publish(ampl.getObjective('MaxCourDist').value(), sol, 'mip')
+    if solve_result == "solved":
+        incumbent.prove_optimal('mip')
+
+
+MEMBER_RUNNERS = {
+    'cp': run_cp_member,
+    'sat': run_sat_member,
+    'smt': run_smt_member,
+    'mip': run_mip_member
+}
+
+
+def run_member(member, incumbent, file_name, timeout_seconds):
+    # New process group, so that the solvers spawned by the member die with it
+    os.setsid()
+    try:
+        MEMBER_RUNNERS[member](incumbent, file_name, timeout_seconds)
+    except Exception as e:
+        print(f"[portfolio] {member} failed: {e}")
+
+
+def run_portfolio(file_name, members, timeout_seconds):
+    incumbent = SharedIncumbent()
+    processes = [mp.Process(target=run_member, args=(member, incumbent, file_name, timeout_seconds))
+                 for member in members]
+
+    best_obj, best_sol, winner = None, None, None
+
+    def collect(timeout):
+        nonlocal best_obj, best_sol, winner
+        try:
+            obj, sol, source = incumbent.solutions.get(timeout=timeout)
+        except queue.Empty:
+            return
+        if obj is not None and (best_obj is None or obj < best_obj):
+            best_obj, best_sol, winner = obj, sol, source
+
+    start_time = time.time()
+    for process in processes:
+        process.start()
+
+    deadline = start_time + timeout_seconds
+    while time.time() < deadline and not incumbent.optimal.is_set() and any(p.is_alive() for p in processes):
+        collect(0.1)
+    solving_time = time.time() - start_time
+    optimal = incumbent.optimal.is_set()
+
+    # The solution matching the shared incumbent may still be in transit
+    grace = time.time() + 5
+    while time.time() < grace and (best_obj is None or best_obj != incumbent.bound()) and incumbent.bound() is not None:
+        collect(0.1)
+
+    for process in processes:
+        if process.is_alive():
+            try:
+                os.killpg(process.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                process.kill()
+        process.join()
+
+    return best_obj, solving_time, optimal, best_sol, winner
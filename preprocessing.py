@@ -0,0 +1,54 @@
+import math
+from bounds import shortest_paths
+
+
+def prune_arcs(m, n, l, s, D, upper_bound=None, verbose=False):
+    # arcs[j][k] is False when no routing with maximum distance <= upper_bound can
+    # travel from j to k, with items 0..n-1 and the depot n as in the instance files
+    import numpy as np
+    arcs = np.ones((n + 1, n + 1), dtype=bool)
+    np.fill_diagonal(arcs, False)
+
+    # Two items that do not fit together in the largest courier never share a route
+    sizes = np.array(s, dtype=np.int64)
+    arcs[:n, :n] &= sizes[:, None] + sizes[None, :] <= max(l)
+
+    # A route using j -> k is at least as long as depot ~> j -> k ~> depot
+    if upper_bound is not None:
+        sp = shortest_paths(D)
+        arcs &= sp[n, :, None] + np.array(D, dtype=np.int64) + sp[None, :, n] <= upper_bound
+
+    if verbose:
+        print(f"Arc pruning: {arcs.sum()} of {n * (n + 1)} arcs kept")
+    return arcs
+
+
+def capacity_classes(l):
+    # Couriers grouped by capacity, each class in index order. The couriers of a
+    # class are interchangeable: swapping their routes keeps every constraint and
+    # the objective.
+    classes = {}
+    for i, li in enumerate(l):
+        classes.setdefault(li, []).append(i)
+    return list(classes.values())
+
+
+# Destroy and repair steps of the heuristic run bounding the kept arcs
+HEURISTIC_ITERATIONS = 10
+
+
+def heuristic_arcs(m, n, l, s, D, iterations=HEURISTIC_ITERATIONS, lower_bound=0, verbose=False):
+    # Arcs usable by a routing at least as good as a short heuristic run. The run
+    # is bounded by its number of iterations, not by the clock, and the LNS seed is
+    # fixed, so an instance always keeps the same arcs
+    from Models.LNS.lns import heuristic_upper_bound
+    upper_bound, _ = heuristic_upper_bound(m, n, s, l, D, math.inf, lower_bound, iterations)
+    return prune_arcs(m, n, l, s, D, upper_bound, verbose)
+
+
+def arc_lists(arcs):
+    # Successors and predecessors of every node through the kept arcs
+    size = len(arcs)
+    out_arcs = [[k for k in range(size) if arcs[j][k]] for j in range(size)]
+    in_arcs = [[j for j in range(size) if arcs[j][k]] for k in range(size)]
+    return out_arcs, in_arcs
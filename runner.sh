@@ -5,11 +5,7 @@ MODEL=$2
 SOLVER=$3
 LOWER_BOUND=$4
 UPPER_BOUND=$5
-SCRIPT="mcp.py"
+JOBS=${6:-$(nproc)}
+SCRIPT="campaign.py"
 
-for i in $(seq -w $LOWER_BOUND $UPPER_BOUND); do 
-    INSTANCE="./Instances/inst$i.dat"
-
-    python $SCRIPT $INSTANCE $METHOD $MODEL $SOLVER 275
-
-done
+python $SCRIPT $METHOD:$MODEL:$SOLVER --instances $((10#$LOWER_BOUND))-$((10#$UPPER_BOUND)) --jobs $JOBS --timeout 275
@@ -6,6 +6,8 @@ class MethodType(Enum):
     SAT = 'sat'
     SMT = 'smt'
     MIP = 'mip'
+    LNS = 'lns'
+    PORTFOLIO = 'portfolio'
 
 
 def read_instances(file_name):
@@ -49,9 +51,9 @@ def extract_integer_from_filename(file_name: str):
 
 
 def write_json_file(key, obj, time, optimal, sol, path):
-    import os
     import json
     import math
+    import fcntl
 
     if not optimal:
         time = 300
@@ -64,21 +66,27 @@ def write_json_file(key, obj, time, optimal, sol, path):
     }
 
     print("Data to write:", data)
-    if os.path.exists(path):
-        try:
-            with open(path, 'r') as json_file:
+    # Several jobs of a campaign may write the same instance file concurrently,
+    # so the read-modify-write below happens under an exclusive lock.
+    with open(path, 'a+') as json_file:
+        fcntl.flock(json_file, fcntl.LOCK_EX)
+        json_file.seek(0)
+        content = json_file.read()
+        if content:
+            try:
                 print("Reading existing JSON file.")
-                file_data = json.load(json_file)
+                file_data = json.loads(content)
                 print("Existing file data:", file_data)
-        except json.JSONDecodeError as e:
-            print(f"Error decoding JSON from file: {e}")
+            except json.JSONDecodeError as e:
+                print(f"Error decoding JSON from file: {e}")
+                file_data = {}
+        else:
             file_data = {}
-    else:
-        file_data = {}
 
-    file_data[key] = data
+        file_data[key] = data
 
-    with open(path, 'w') as json_file:
+        json_file.seek(0)
+        json_file.truncate()
         json.dump(file_data, json_file, indent=4)
 
     print(f"JSON file successfully written to {path}")
@@ -109,6 +117,48 @@ def make_initial_routes(n, capacities, s, D):
     return routes
 
 
+def pad_routes(sols, m=None):
+    # Batch of solutions (lists of routes of 1-based items) -> int array of shape
+    # (solutions, couriers, longest route) padded with zeros
+    import numpy as np
+    if m is None:
+        m = max((len(sol) for sol in sols), default=0)
+    length = max((len(route) for sol in sols for route in sol), default=0)
+    routes = np.zeros((len(sols), m, length), dtype=np.int64)
+    for b, sol in enumerate(sols):
+        for k, route in enumerate(sol):
+            routes[b, k, :len(route)] = route
+    return routes
+
+
+def evaluate_routes(routes, D, s=None, l=None):
+    # routes: int array (solutions, couriers, positions) of 1-based items, where 0
+    # stands for the depot, e.g. the output of pad_routes. Returns the distance and
+    # the load of every courier, the capacity violations and the objective of
+    # every solution. Loads and violations are None when s and l are not given.
+    import numpy as np
+    routes = np.asarray(routes, dtype=np.int64)
+    D = np.asarray(D)
+    depot = D.shape[0] - 1
+
+    # Depot at both ends; a padding zero between two items of a route is a
+    # depot -> depot arc of length 0
+    nodes = np.where(routes > 0, routes - 1, depot)
+    ends = np.full(nodes.shape[:-1] + (1,), depot)
+    nodes = np.concatenate([ends, nodes, ends], axis=-1)
+    distances = D[nodes[..., :-1], nodes[..., 1:]].sum(axis=-1)
+    objective = distances.max(axis=-1)
+
+    loads, violations = None, None
+    if s is not None:
+        sizes = np.append(np.asarray(s), 0)
+        loads = sizes[nodes].sum(axis=-1)
+        if l is not None:
+            violations = loads > np.asarray(l)
+
+    return distances, loads, violations, objective
+
+
 def print_result(solving_time, solve_result, obj, sol, is_valid):
     print(f"\n{'='*50}")
     print(f"{'Valid' if is_valid else 'Invalid'} solution found!")
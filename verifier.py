@@ -2,6 +2,7 @@ import os
 import re
 import sys
 import json
+from util import pad_routes, evaluate_routes
 
 TIMEOUT = 300
 # OPT[i] = Optimal value for instance i. 
@@ -67,6 +68,7 @@ def main(args):
           i += 1
       for i in range(len(dist_matrix)):
         assert dist_matrix[i][i] == 0
+      checked = []
       for solver, result in results.items():
         print(f'\t\tChecking solver {solver}')
         header = f'Solver {solver}, instance {inst_number}'
@@ -74,29 +76,26 @@ def main(args):
           errors += [f"{header}: runtime unsound ({result['time']} sec.)"]
         if 'sol' not in result or not result['sol'] or result['sol'] == 'N/A':
           continue
-        max_dist = 0
+        checked.append((solver, result))
+      if not checked:
+        continue
+      # All the solutions of the instance are evaluated in a single batch.
+      m = max(n_couriers, max(len(result['sol']) for _, result in checked))
+      routes = pad_routes([result['sol'] for _, result in checked], m)
+      dists, loads, violations, max_dists = evaluate_routes(routes, dist_matrix, sizes, capacity + [0] * (m - n_couriers))
+      for b, (solver, result) in enumerate(checked):
+        header = f'Solver {solver}, instance {inst_number}'
         n_collected = sum(len(p) for p in result['sol'])
         if n_collected != n_items:
           errors += [f"{header}: solution {result['sol']} collects {n_collected} instead of {n_items} items"]
-        courier_id = 0
-        for path in result['sol']:
-          dist = 0
-          path_size = 0
-          # Adjusting with origin point.
-          path = [n_items+1] + path + [n_items+1]          
-          for i in range(1, len(path)):
-            curr_item = path[i] - 1
-            prev_item = path[i-1] - 1            
-            dist += dist_matrix[prev_item][curr_item]
-            if i < len(path) - 1:
-              path_size += sizes[curr_item]
-          if path_size > capacity[courier_id]:
-            errors += [f"{header}: path {path} of courier {courier_id} has total size {path_size}, exceeding its capacity {capacity[courier_id]}"]
-          if dist > max_dist:
-            max_dist = dist
-            max_path = path
-            max_cour = courier_id
-          courier_id += 1
+        for courier_id, path in enumerate(result['sol']):
+          if violations[b][courier_id]:
+            # Adjusting with origin point.
+            path = [n_items+1] + path + [n_items+1]
+            errors += [f"{header}: path {path} of courier {courier_id} has total size {loads[b][courier_id]}, exceeding its capacity {capacity[courier_id]}"]
+        max_dist = int(max_dists[b])
+        max_cour = int(dists[b].argmax())
+        max_path = [n_items+1] + (result['sol'][max_cour] if max_cour < len(result['sol']) else []) + [n_items+1]
         if max_dist != result['obj']:
           errors += [f"{header}: objective value {result['obj']} inconsistent with max. distance {max_dist} of path {max_path}, courier {max_cour})"]
         i = int(inst_number)